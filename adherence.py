@@ -0,0 +1,160 @@
+import collections
+import datetime
+
+# Подтверждения приема в программе нет: запись в журнал появляется, когда
+# планировщик отправил напоминание или прием внесли вручную. Поэтому сводки
+# считают записи журнала (столбец scheduled), записи с известным временем
+# получения (taken) и задержку записи от времени по графику. Для приемов из
+# графика это задержка напоминания, а не время, когда лекарство выпили.
+
+# Прием, записанный позже чем через LATE_AFTER секунд, считается пропущенным.
+LATE_AFTER = 15 * 60
+
+# Нижние границы интервалов задержки в минутах. Распределение задержек
+# хранится в сводках числом приемов в каждом интервале (столбцы late_<N>),
+# медиана и 95-й процентиль определяются с точностью до интервала.
+BUCKETS = (0, 1, 2, 5, 10, 15, 30, 60, 120, 240, 480, 720, 1440, 2880)
+BUCKET_COLUMNS = tuple(f"late_{minutes}" for minutes in BUCKETS)
+
+# Дневные сводки нужны для произвольных границ периода, месячные — чтобы
+# отчет за несколько лет складывал десятки строк на лекарство, а не тысячи.
+PERIODS = {
+    "adherence_daily": "date",
+    "adherence_monthly": "substr(date, 1, 7)",
+}
+
+# Задержка записи журнала в секундах. У приемов из графика она сохранена
+# при записи, у внесенных вручную считается по времени получения; без
+# времени получения задержка неизвестна (NULL).
+LATENESS = '''
+    MAX(COALESCE(delay_seconds,
+                 strftime('%s', received_time)
+                 - strftime('%s', date || ' ' || time)), 0)
+'''
+
+
+def bucket_count(index):
+    low = BUCKETS[index] * 60
+    if index + 1 == len(BUCKETS):
+        return f":sign * COUNT(CASE WHEN lateness >= {low} THEN 1 END)"
+    high = BUCKETS[index + 1] * 60
+    return (f":sign * COUNT(CASE WHEN lateness >= {low} "
+            f"AND lateness < {high} THEN 1 END)")
+
+
+# Записи журнала, выбранные условием, прибавляются к сводкам (или
+# вычитаются при :sign = -1). Журнал целиком не перечитывается: без
+# NOT INDEXED планировщик идет по индексу (patient_id, name, date) ради
+# группировки и просматривает весь журнал вместо нескольких новых id.
+ROLLUP = f'''
+    INSERT INTO {{table}} (patient_id, name, period, scheduled, taken, on_time,
+                          {", ".join(BUCKET_COLUMNS)})
+    SELECT patient_id, name, {{period}}, :sign * COUNT(*),
+           :sign * COUNT(lateness),
+           :sign * COUNT(CASE WHEN lateness < :late_after THEN 1 END),
+           {", ".join(bucket_count(index) for index in range(len(BUCKETS)))}
+    FROM (SELECT patient_id, name, date, {LATENESS} AS lateness
+          FROM medicines_log NOT INDEXED WHERE {{condition}})
+    GROUP BY patient_id, name, {{period}}
+    ON CONFLICT (patient_id, name, period) DO UPDATE SET
+        scheduled = scheduled + excluded.scheduled,
+        taken = taken + excluded.taken,
+        on_time = on_time + excluded.on_time,
+        {", ".join(f"{column} = {column} + excluded.{column}"
+                   for column in BUCKET_COLUMNS)}
+'''
+
+# После вычитания опустевшие строки сводок удаляются.
+PRUNE = '''
+    DELETE FROM {table}
+    WHERE scheduled <= 0 AND (patient_id, name, period) IN (
+        SELECT patient_id, name, {period} FROM medicines_log NOT INDEXED
+        WHERE {condition})
+'''
+
+# Сводки не уменьшаются при переносе журнала в архив, поэтому отчет
+# за несколько лет читает только их и не открывает архивы.
+REPORT = f'''
+    SELECT name, SUM(scheduled), SUM(taken), SUM(on_time),
+           {", ".join(f"SUM({column})" for column in BUCKET_COLUMNS)}
+    FROM {{table}}
+    WHERE patient_id = :patient_id AND period BETWEEN :start AND :end
+    GROUP BY name
+'''
+
+AdherenceRow = collections.namedtuple(
+    "AdherenceRow",
+    "name logged received on_time median_minutes p95_minutes")
+
+
+def record(conn, condition="1", params=None, sign=1):
+    params = dict(params or {}, sign=sign, late_after=LATE_AFTER)
+    for table, period in PERIODS.items():
+        conn.execute(ROLLUP.format(table=table, period=period,
+                                   condition=condition), params)
+        if sign < 0:
+            conn.execute(PRUNE.format(table=table, period=period,
+                                      condition=condition), params)
+
+
+def split_period(start, end):
+    # Полные месяцы периода берутся из месячных сводок, оставшиеся дни
+    # в начале и в конце — из дневных.
+    first = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    months_from = first if first.day == 1 else (
+        first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    months_until = (last + datetime.timedelta(days=1)).replace(day=1)
+    if months_from >= months_until:
+        return [("adherence_daily", start, end)]
+    parts = [("adherence_monthly", months_from.strftime("%Y-%m"),
+              (months_until - datetime.timedelta(days=1)).strftime("%Y-%m"))]
+    if first < months_from:
+        parts.append(("adherence_daily", start,
+                      (months_from - datetime.timedelta(days=1)).isoformat()))
+    if months_until <= last:
+        parts.append(("adherence_daily", months_until.isoformat(), end))
+    return parts
+
+
+def percentile(histogram, fraction):
+    # Возвращается нижняя граница интервала, в который попал процентиль,
+    # точнее по сводкам его не определить.
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for minutes, doses in zip(BUCKETS, histogram):
+        seen += doses
+        if seen >= total * fraction:
+            return minutes
+    return BUCKETS[-1]
+
+
+def report(conn, patient_id, start, end):
+    if start > end:
+        return []
+    sums = {}
+    for table, part_start, part_end in split_period(start, end):
+        params = {"patient_id": patient_id, "start": part_start,
+                  "end": part_end}
+        for row in conn.execute(REPORT.format(table=table), params):
+            current = sums.get(row[0])
+            sums[row[0]] = row[1:] if current is None else [
+                a + b for a, b in zip(current, row[1:])]
+
+    rows = []
+    overall = [0] * (3 + len(BUCKETS))
+    for name in sorted(sums):
+        values = sums[name]
+        if values[0] <= 0:
+            continue
+        rows.append(AdherenceRow(name, *values[:3],
+                                 percentile(values[3:], 0.5),
+                                 percentile(values[3:], 0.95)))
+        overall = [a + b for a, b in zip(overall, values)]
+    if rows:
+        rows.append(AdherenceRow(None, *overall[:3],
+                                 percentile(overall[3:], 0.5),
+                                 percentile(overall[3:], 0.95)))
+    return rows
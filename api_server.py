@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+import base64
+import concurrent.futures
+import json
+import os
+import queue
+import sqlite3
+import sys
+import time
+import traceback
+import urllib.parse
+
+import bulk_io
+import repository
+from repository import DATABASE, MedicineRepository
+
+HOST = "127.0.0.1"
+PORT = 8765
+READERS = 4
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_BODY = 64 * 1024
+# Числа больше sqlite3 не может передать в запрос (OverflowError).
+MAX_ID = bulk_io.MAX_INT
+# Если переменная задана, каждый запрос должен передать этот токен
+# в заголовке Authorization: Bearer <токен>.
+TOKEN_VARIABLE = "MEDICINES_API_TOKEN"
+
+RESOURCES = {
+    "inventory": {
+        "kind": "inventory",
+        "columns": ("id", "name", "quantity"),
+        "order": ("name", "id"),
+        "descending": False,
+    },
+    "medicines": {
+        "kind": "schedule",
+        "columns": ("id", "name", "dosage", "date", "time", "rule_id"),
+        "order": ("date", "time", "id"),
+        "descending": False,
+    },
+    "medicines_log": {
+        "kind": "log",
+        "columns": ("id", "name", "dosage", "date", "time", "received_time",
+                    "description"),
+        "order": ("date", "time", "id"),
+        "descending": True,
+    },
+}
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+    401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large",
+    431: "Request Header Fields Too Large", 500: "Internal Server Error",
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ApiError(400, "некорректный параметр after") from None
+    if not isinstance(values, list) or len(values) != size or not all(
+            isinstance(value, str) or (isinstance(value, int)
+                                       and abs(value) <= MAX_ID)
+            for value in values):
+        raise ApiError(400, "некорректный параметр after")
+    return values
+
+
+class ReadPool:
+    # Соединения только для чтения раздаются потокам исполнителя по одному,
+    # в режиме WAL чтение не ждет записи ни здесь, ни в окне программы.
+    def __init__(self, database, size=READERS):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(repository.connect(
+                database, check_same_thread=False, read_only=True))
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="api-read")
+
+    def call(self, function, *args):
+        conn = self.connections.get()
+        try:
+            return function(conn, *args)
+        finally:
+            self.connections.put(conn)
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.call,
+                                          function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class Writer:
+    # Все изменения идут через один репозиторий в одном потоке. С окном
+    # программы и службой напоминаний запись разделяется транзакциями
+    # BEGIN IMMEDIATE и ожиданием блокировки в sqlite3.
+    def __init__(self, database):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="api-write")
+        self.repo = self.executor.submit(
+            MedicineRepository, database, False).result()
+
+    def call(self, patient_id, function, *args):
+        self.repo.set_patient(patient_id)
+        return function(self.repo, *args)
+
+    async def run(self, patient_id, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.call,
+                                          patient_id, function, *args)
+
+    def close(self):
+        self.executor.submit(self.repo.close).result()
+        self.executor.shutdown(wait=True)
+
+
+def patient_exists(conn, patient_id):
+    return conn.execute("SELECT 1 FROM patients WHERE id = ?",
+                        (patient_id,)).fetchone() is not None
+
+
+def row_dict(spec, row):
+    return dict(zip(spec["columns"], row))
+
+
+def list_rows(conn, resource, patient_id, limit, after):
+    spec = RESOURCES[resource]
+    keys = spec["order"]
+    direction = "DESC" if spec["descending"] else "ASC"
+    sql = f"SELECT {', '.join(spec['columns'])} FROM {resource} WHERE patient_id = ?"
+    params = [patient_id]
+    if after is not None:
+        sql += (f" AND ({', '.join(keys)}) {'<' if spec['descending'] else '>'} "
+                f"({', '.join('?' * len(keys))})")
+        params.extend(after)
+    sql += (" ORDER BY " + ", ".join(f"{key} {direction}" for key in keys)
+            + " LIMIT ?")
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    items = [row_dict(spec, row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1][key] for key in keys])
+    return {"items": items, "next": next_cursor}
+
+
+def get_row(conn, resource, patient_id, row_id):
+    spec = RESOURCES[resource]
+    row = conn.execute(
+        f"SELECT {', '.join(spec['columns'])} FROM {resource} WHERE id = ? AND patient_id = ?",
+        (row_id, patient_id)).fetchone()
+    return None if row is None else row_dict(spec, row)
+
+
+def owned(repo, resource, row_id):
+    return repo.query_one(
+        f"SELECT 1 FROM {resource} WHERE id = ? AND patient_id = ?",
+        (row_id, repo.patient_id)) is not None
+
+
+def create_inventory(repo, values):
+    name, quantity = values
+    try:
+        return repo.add_inventory_item(name, quantity)
+    except sqlite3.IntegrityError:
+        raise ApiError(409, f"лекарство '{name}' уже есть в запасах") from None
+
+
+def update_inventory(repo, row_id, values):
+    if not owned(repo, "inventory", row_id):
+        raise ApiError(404, "запись не найдена")
+    try:
+        repo.update_inventory_item(row_id, *values)
+    except sqlite3.IntegrityError:
+        raise ApiError(409, f"лекарство '{values[0]}' уже есть в запасах") from None
+
+
+def delete_inventory(repo, row_id):
+    if not owned(repo, "inventory", row_id):
+        raise ApiError(404, "запись не найдена")
+    repo.delete_inventory_item(row_id)
+
+
+def check_stock(repo, name, dosage):
+    stock = repo.stock_level(name)
+    if stock is None:
+        raise ApiError(409, f"лекарства '{name}' нет в запасах")
+    if dosage > stock:
+        raise ApiError(409, f"недостаточно лекарства '{name}': "
+                            f"требуется {dosage}, осталось {stock}")
+
+
+def check_due(due_at):
+    # Как и окно программы, API не принимает прием в прошлом: планировщик
+    # сразу перенес бы его в журнал.
+    if due_at < time.time():
+        raise ApiError(400, "время приема не может быть раньше текущего времени")
+
+
+def create_medicine(repo, values):
+    name, dosage, date, time_, due_at = values
+    check_due(due_at)
+    with repo.transaction():
+        check_stock(repo, name, dosage)
+        return repo.schedule_dose(name, dosage, date, time_)
+
+
+def update_medicine(repo, row_id, values):
+    if not owned(repo, "medicines", row_id):
+        raise ApiError(404, "запись не найдена")
+    check_due(values[4])
+    try:
+        repo.update_dose(row_id, *values[:4])
+    except ValueError as e:
+        raise ApiError(409, str(e)) from None
+
+
+def delete_medicine(repo, row_id):
+    if not owned(repo, "medicines", row_id):
+        raise ApiError(404, "запись не найдена")
+    repo.cancel_dose(row_id)
+
+
+def create_log(repo, values):
+    return repo.add_log_entry(*values)
+
+
+def update_log(repo, row_id, description):
+    if not owned(repo, "medicines_log", row_id):
+        raise ApiError(404, "запись не найдена")
+    repo.set_log_description(row_id, description)
+
+
+def delete_log(repo, row_id):
+    if not owned(repo, "medicines_log", row_id):
+        raise ApiError(404, "запись не найдена")
+    repo.delete_log_entry(row_id)
+
+
+WRITES = {
+    "inventory": (create_inventory, update_inventory, delete_inventory),
+    "medicines": (create_medicine, update_medicine, delete_medicine),
+    "medicines_log": (create_log, update_log, delete_log),
+}
+
+
+def int_parameter(query, name, default, minimum=1, maximum=MAX_ID):
+    value = query.get(name, [None])[0]
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"параметр {name} должен быть целым числом") from None
+    if number < minimum or number > maximum:
+        raise ApiError(400, f"параметр {name} вне допустимого диапазона")
+    return number
+
+
+def row_id_part(part):
+    # str.isdigit() пропускает и цифры других алфавитов, а id вне
+    # диапазона INTEGER заведомо не существует.
+    if not (part.isascii() and part.isdigit()) or \
+            len(part) > len(str(MAX_ID)) or int(part) > MAX_ID:
+        raise ApiError(404, "ресурс не найден")
+    return int(part)
+
+
+def parse_body(body):
+    try:
+        record = json.loads(body.decode("utf-8") or "null")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ApiError(400, f"некорректный JSON: {e}") from None
+    if not isinstance(record, dict):
+        raise ApiError(400, "тело запроса должно быть объектом JSON")
+    return record
+
+
+class ApiServer:
+    def __init__(self, database=DATABASE, readers=READERS):
+        self.readers = ReadPool(database, readers)
+        self.writer = Writer(database)
+        self.token = os.environ.get(TOKEN_VARIABLE) or None
+
+    def close(self):
+        self.readers.close()
+        self.writer.close()
+
+    async def handle(self, method, target, headers, body):
+        if self.token is not None and \
+                headers.get("authorization") != f"Bearer {self.token}":
+            raise ApiError(401, "требуется токен доступа")
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        if not parts or parts[0] not in RESOURCES or len(parts) > 2:
+            raise ApiError(404, "ресурс не найден")
+        resource = parts[0]
+        row_id = None
+        if len(parts) == 2:
+            row_id = row_id_part(parts[1])
+
+        patient_id = int_parameter(query, "patient", repository.DEFAULT_PATIENT)
+        if not await self.readers.run(patient_exists, patient_id):
+            raise ApiError(404, f"пациент {patient_id} не найден")
+
+        spec = RESOURCES[resource]
+        create, update, delete = WRITES[resource]
+        if method == "GET" and row_id is None:
+            limit = int_parameter(query, "limit", DEFAULT_LIMIT,
+                                  maximum=MAX_LIMIT)
+            after = query.get("after", [None])[0]
+            if after is not None:
+                after = decode_cursor(after, len(spec["order"]))
+            return 200, await self.readers.run(list_rows, resource,
+                                               patient_id, limit, after)
+        if method == "GET":
+            row = await self.readers.run(get_row, resource, patient_id, row_id)
+            if row is None:
+                raise ApiError(404, "запись не найдена")
+            return 200, row
+        if method == "POST" and row_id is None:
+            values = self.validate(spec, parse_body(body))
+            new_id = await self.writer.run(patient_id, create, values)
+            return 201, await self.readers.run(get_row, resource, patient_id,
+                                               new_id)
+        if method in ("PUT", "PATCH") and row_id is not None:
+            record = parse_body(body)
+            if resource == "medicines_log":
+                # В журнале меняется только описание, сам факт приема
+                # остается таким, каким его записал планировщик.
+                description = record.get("description")
+                values = None if description is None else str(description)
+            else:
+                values = self.validate(spec, record)
+            await self.writer.run(patient_id, update, row_id, values)
+            return 200, await self.readers.run(get_row, resource, patient_id,
+                                               row_id)
+        if method == "DELETE" and row_id is not None:
+            await self.writer.run(patient_id, delete, row_id)
+            return 204, None
+        raise ApiError(405, "метод не поддерживается")
+
+    @staticmethod
+    def validate(spec, record):
+        try:
+            return bulk_io.validate(spec["kind"], record)
+        except ValueError as e:
+            raise ApiError(400, str(e)) from None
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self.handle(method, target,
+                                                        headers, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except sqlite3.Error as e:
+                    status, payload = 500, {"error": f"ошибка базы данных: {e}"}
+                except Exception:
+                    # Ошибка в обработчике не должна обрывать соединение
+                    # без ответа: клиент получает 500, подробности — в журнал.
+                    traceback.print_exc(file=sys.stderr)
+                    status, payload = 500, {"error": "внутренняя ошибка сервера"}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ApiError as e:
+            writer.write(response(e.status, {"error": str(e)}, False))
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_line(reader):
+    # Строка длиннее буфера потока (64 КБ) вызывает ValueError в readline.
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise ApiError(431, "слишком длинная строка запроса или заголовок") from None
+
+
+async def read_request(reader):
+    line = await read_line(reader)
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "некорректная строка запроса") from None
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ApiError(400, "некорректный Content-Length") from None
+    if length < 0:
+        raise ApiError(400, "некорректный Content-Length")
+    if length > MAX_BODY:
+        raise ApiError(413, "слишком большое тело запроса")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def response(status, payload, keep_alive):
+    body = b"" if payload is None else json.dumps(
+        payload, ensure_ascii=False).encode("utf-8")
+    head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if body:
+        head.append("Content-Type: application/json; charset=utf-8")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(api, host=HOST, port=PORT, ready=None):
+    server = await asyncio.start_server(api.serve_client, host, port)
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="HTTP/JSON API для расписания, запасов и журнала")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--host", default=HOST,
+                        help="адрес, 0.0.0.0 для доступа из локальной сети")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--readers", type=int, default=READERS)
+    args = parser.parse_args(argv[1:])
+
+    api = ApiServer(args.database, args.readers)
+    if args.host not in ("127.0.0.1", "localhost") and api.token is None:
+        print(f"Внимание: API доступен по сети без токена, задайте {TOKEN_VARIABLE}",
+              file=sys.stderr)
+    print(f"API слушает http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(serve(api, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,162 @@
+import datetime
+import os
+import re
+import sqlite3
+
+import migrations
+
+ARCHIVE_DIRECTORY = "archive"
+ALL_LOG_VIEW = "medicines_log_all"
+KEEP_DAYS = 365
+# SQLite позволяет подключить не больше десяти баз, одна занята основной.
+MAX_ATTACHED = 9
+# Записи переносятся порциями, каждая в своей транзакции: окно программы
+# и служба напоминаний не ждут блокировку записи, пока идет перенос.
+BATCH_SIZE = 2000
+
+ARCHIVE_NAME = re.compile(r"^medicines_log_(\d{4})\.db$")
+ARCHIVE_SCHEMA = re.compile(r"^archive_\d{4}$")
+
+
+def archive_path(year, directory=ARCHIVE_DIRECTORY):
+    return os.path.join(directory, f"medicines_log_{year}.db")
+
+
+def archive_years(directory=ARCHIVE_DIRECTORY):
+    if not os.path.isdir(directory):
+        return []
+    years = []
+    for name in os.listdir(directory):
+        match = ARCHIVE_NAME.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def schema_name(year):
+    return f"archive_{year}"
+
+
+def table_columns(conn, schema, table="medicines_log"):
+    return [row[1] for row in
+            conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def prepare_archive(conn, year, directory):
+    # Схема архива повторяет текущую схему журнала: новые столбцы,
+    # добавленные миграциями, дописываются в старые архивы.
+    os.makedirs(directory, exist_ok=True)
+    table_sql = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'medicines_log'"
+    ).fetchone()[0]
+    archive = sqlite3.connect(archive_path(year, directory),
+                              isolation_level=None)
+    try:
+        archive.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        archive.execute("BEGIN")
+        archive.execute(table_sql.replace("CREATE TABLE",
+                                          "CREATE TABLE IF NOT EXISTS", 1))
+        existing = set(table_columns(archive, "main"))
+        for column in conn.execute("PRAGMA main.table_info(medicines_log)"):
+            if column[1] not in existing:
+                default = "" if column[4] is None else f" DEFAULT {column[4]}"
+                archive.execute(
+                    f"ALTER TABLE medicines_log ADD COLUMN {column[1]} {column[2]}{default}")
+        for statement in migrations.LOG_INDEXES:
+            archive.execute(statement)
+        cursor = archive.cursor()
+        for statement in migrations.search_index_statements(
+                "medicines_log", migrations.SEARCH_INDEXES["medicines_log"]):
+            cursor.execute(statement)
+        archive.execute("COMMIT")
+    finally:
+        archive.close()
+
+
+def rollover(repo, today=None, keep_days=KEEP_DAYS,
+             directory=ARCHIVE_DIRECTORY, batch_size=BATCH_SIZE):
+    today = today or datetime.date.today()
+    cutoff = (today - datetime.timedelta(days=keep_days)).isoformat()
+    years = [int(row[0]) for row in repo.query_all(
+        "SELECT DISTINCT substr(date, 1, 4) FROM medicines_log WHERE date < ?",
+        (cutoff,))]
+    if not years:
+        return 0
+
+    columns = ", ".join(table_columns(repo.conn, "main"))
+    moved = 0
+    for year in years:
+        prepare_archive(repo.conn, year, directory)
+        schema = f"rollover_{year}"
+        repo.conn.execute(f"ATTACH DATABASE ? AS {schema}",
+                          (archive_path(year, directory),))
+        try:
+            period = (f"{year}-01-01", min(f"{year + 1}-01-01", cutoff))
+            ids = [row[0] for row in repo.query_all(
+                "SELECT id FROM main.medicines_log "
+                "WHERE date >= ? AND date < ? ORDER BY id", period)]
+            # Порция задается диапазоном id, условие по дате отсекает
+            # попавшие в диапазон более новые записи.
+            for start in range(0, len(ids), batch_size):
+                batch = (ids[start], ids[min(start + batch_size, len(ids)) - 1],
+                         *period)
+                with repo.transaction() as conn:
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO {schema}.medicines_log ({columns}) "
+                        f"SELECT {columns} FROM main.medicines_log "
+                        f"WHERE id BETWEEN ? AND ? AND date >= ? AND date < ?",
+                        batch)
+                    moved += conn.execute(
+                        "DELETE FROM main.medicines_log "
+                        "WHERE id BETWEEN ? AND ? AND date >= ? AND date < ?",
+                        batch).rowcount
+                    repo.changed("medicines_log")
+        finally:
+            repo.conn.execute(f"DETACH DATABASE {schema}")
+    repo.conn.execute(
+        "INSERT INTO main.medicines_log_fts (medicines_log_fts) VALUES ('optimize')")
+    # Полный VACUUM переписал бы всю базу под блокировкой записи, поэтому
+    # место освобождается, только если база создана с auto_vacuum =
+    # INCREMENTAL. execute() останавливается после первого шага PRAGMA и
+    # освобождает одну страницу, executescript выполняет очистку до конца.
+    if repo.conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+        repo.conn.executescript("PRAGMA main.incremental_vacuum")
+    # В режиме WAL файл базы уменьшается только после контрольной точки.
+    repo.conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    return moved
+
+
+def attach_archives(conn, directory=ARCHIVE_DIRECTORY):
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    schemas = ["main"]
+    for year in archive_years(directory)[-MAX_ATTACHED:]:
+        schema = schema_name(year)
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}",
+                         (archive_path(year, directory),))
+        schemas.append(schema)
+
+    columns = table_columns(conn, "main")
+    defaults = {row[1]: row[4] for row in
+                conn.execute("PRAGMA main.table_info(medicines_log)")}
+    selects = [f"SELECT {', '.join(columns)} FROM main.medicines_log"]
+    for schema in schemas[1:]:
+        present = set(table_columns(conn, schema))
+        values = ", ".join(
+            column if column in present
+            else f"{defaults[column] or 'NULL'} AS {column}"
+            for column in columns)
+        selects.append(f"SELECT {values} FROM {schema}.medicines_log")
+    conn.execute(f"DROP VIEW IF EXISTS temp.{ALL_LOG_VIEW}")
+    conn.execute(f"CREATE TEMP VIEW {ALL_LOG_VIEW} AS "
+                 + " UNION ALL ".join(selects))
+    return tuple(schemas)
+
+
+def detach_archives(conn):
+    # Подключенные архивы блокируются каждой транзакцией записи вместе
+    # с основной базой, поэтому они отключаются, когда больше не нужны.
+    conn.execute(f"DROP VIEW IF EXISTS temp.{ALL_LOG_VIEW}")
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        if ARCHIVE_SCHEMA.match(row[1]):
+            conn.execute(f"DETACH DATABASE {row[1]}")
@@ -0,0 +1,98 @@
+import os
+
+from PyQt6.QtCore import QRect, QSize, Qt
+from PyQt6.QtGui import QGuiApplication, QImageReader, QPixmap, QPixmapCache
+
+CACHE_DIRECTORY = "asset_cache"
+# QPixmapCache вытесняет давно не использованные картинки, как только их
+# общий объем превышает лимит.
+CACHE_LIMIT_KB = 32 * 1024
+JPEG_QUALITY = 90
+
+QPixmapCache.setCacheLimit(CACHE_LIMIT_KB)
+
+background_styles = {}
+
+
+def cached_path(path, size, mode, directory=CACHE_DIRECTORY):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    if extension.lower() not in (".jpg", ".jpeg"):
+        extension = ".png"
+    return os.path.join(
+        directory, f"{stem}_{size.width()}x{size.height()}_{mode}{extension}")
+
+
+def is_fresh(copy, source):
+    try:
+        return os.path.getmtime(copy) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def save_copy(image, copy):
+    # Дисковый кэш необязателен: если каталог недоступен для записи,
+    # картинка просто будет уменьшаться заново при следующем запуске.
+    try:
+        os.makedirs(os.path.dirname(copy), exist_ok=True)
+        image.save(copy, quality=JPEG_QUALITY)
+    except OSError:
+        pass
+
+
+def decode(path, size, mode):
+    # Уменьшение происходит при декодировании: полноразмерная картинка
+    # целиком в памяти не разворачивается.
+    reader = QImageReader(path)
+    reader.setQuality(100)
+    original = reader.size()
+    if mode == "fit":
+        reader.setScaledSize(original.scaled(
+            size, Qt.AspectRatioMode.KeepAspectRatio))
+    else:
+        reader.setClipRect(QRect(0, 0, min(size.width(), original.width()),
+                                 min(size.height(), original.height())))
+    return reader.read()
+
+
+def image_file(path, size, mode):
+    original = QImageReader(path).size()
+    if not original.isValid() or (original.width() <= size.width()
+                                  and original.height() <= size.height()):
+        return path
+    copy = cached_path(path, size, mode)
+    if not is_fresh(copy, path):
+        image = decode(path, size, mode)
+        if image.isNull():
+            return path
+        save_copy(image, copy)
+        if not is_fresh(copy, path):
+            return path
+    return copy
+
+
+def pixmap(path, size):
+    key = f"{path}@{size.width()}x{size.height()}"
+    cached = QPixmapCache.find(key)
+    if cached is not None:
+        return cached
+    result = QPixmap(image_file(path, size, "fit"))
+    if result.width() > size.width() or result.height() > size.height():
+        result = result.scaled(size, Qt.AspectRatioMode.KeepAspectRatio,
+                               Qt.TransformationMode.SmoothTransformation)
+    QPixmapCache.insert(key, result)
+    return result
+
+
+def background_size():
+    screen = QGuiApplication.primaryScreen()
+    return screen.availableSize() if screen is not None else QSize(1920, 1080)
+
+
+def background_style(path):
+    # Фон из таблицы стилей рисуется без масштабирования от левого верхнего
+    # угла, поэтому за пределами экрана картинку можно обрезать.
+    if path not in background_styles:
+        copy = image_file(path, background_size(), "crop")
+        background_styles[path] = \
+            f"background-image: url('{copy.replace(os.sep, '/')}');"
+    return background_styles[path]
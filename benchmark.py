@@ -0,0 +1,302 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCALES = {
+    "small": {"log_rows": 1_000, "scheduled": 1_000, "inventory": 100},
+    "medium": {"log_rows": 100_000, "scheduled": 10_000, "inventory": 500},
+    "large": {"log_rows": 1_000_000, "scheduled": 10_000, "inventory": 1_000},
+}
+
+NAMES = ["Аспирин", "Парацетамол", "Ибупрофен", "Амоксициллин", "Омепразол",
+         "Лоратадин", "Метформин", "Эналаприл", "Аторвастатин", "Нимесулид"]
+
+SEARCHES = {"fts": "цет", "short": "ас", "clear": ""}
+
+DUE_DOSES = 100
+COURSE_DOSES = 500
+ADHERENCE_YEARS = 3
+
+
+def medicine_names(count):
+    names = list(NAMES[:count])
+    names.extend(f"{NAMES[i % len(NAMES)]} {i}" for i in range(len(names), count))
+    return names
+
+
+def generate(path, log_rows, scheduled, inventory, seed=0):
+    from repository import MedicineRepository, due_timestamp
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    rng = random.Random(seed)
+    names = medicine_names(inventory)
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    repo = MedicineRepository(path)
+    try:
+        with repo.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO inventory (name, quantity) VALUES (?, ?)",
+                ((name, rng.randint(0, 500)) for name in names))
+
+            def doses():
+                for _ in range(scheduled):
+                    due = now + datetime.timedelta(minutes=rng.randint(60, 60 * 24 * 60))
+                    date, time_ = due.strftime("%Y-%m-%d"), due.strftime("%H:%M")
+                    yield (rng.choice(names), rng.randint(1, 3), date, time_,
+                           due_timestamp(date, time_))
+
+            conn.executemany(
+                "INSERT INTO medicines (name, dosage, date, time, due_at) VALUES (?, ?, ?, ?, ?)",
+                doses())
+
+            # Журнал охватывает последние 300 дней, чтобы перенос в архив
+            # при запуске программы не менял базу во время замеров.
+            def log():
+                for _ in range(log_rows):
+                    due = now - datetime.timedelta(minutes=rng.randint(1, 60 * 24 * 300))
+                    taken = due + datetime.timedelta(
+                        minutes=int(rng.expovariate(1 / 10)))
+                    yield (rng.choice(names), rng.randint(1, 3),
+                           due.strftime("%Y-%m-%d"), due.strftime("%H:%M"),
+                           taken.strftime("%Y-%m-%d %H:%M"),
+                           "после еды" if rng.random() < 0.1 else None)
+
+            conn.executemany(
+                "INSERT INTO medicines_log (name, dosage, date, time, received_time, description) VALUES (?, ?, ?, ?, ?, ?)",
+                log())
+            repo.refresh_patient_forecast()
+            repo.reconcile_stock("opening")
+            repo.rebuild_adherence()
+        repo.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        repo.conn.execute("ANALYZE")
+    finally:
+        repo.close()
+
+
+def measure(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def add_due_doses(repo, count=DUE_DOSES):
+    due = datetime.datetime.now() - datetime.timedelta(hours=1)
+    date, time_ = due.strftime("%Y-%m-%d"), due.strftime("%H:%M")
+    with repo.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO medicines (name, dosage, date, time, due_at) VALUES (?, ?, ?, ?, ?)",
+            [(NAMES[0], 1, date, time_, int(due.timestamp()))] * count)
+
+
+def stock_course(repo, quantity):
+    # Базу, переданную через --database, могли уже использовать, поэтому
+    # лекарство для курса может быть на складе: остаток доводится до нужного.
+    current = repo.stock_level("Курс")
+    if current is None:
+        repo.add_inventory_item("Курс", quantity)
+    elif current < quantity:
+        repo.adjust_stock("Курс", quantity - current, "restock")
+
+
+def run_in_process(path, repeat):
+    # Замеры добавляют приемы, курсы и записи журнала, поэтому, как и
+    # запуск, идут на копии базы: следующий запуск видит те же данные.
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, "medicines.db")
+        shutil.copy(path, copy)
+        return measure_in_process(copy, repeat)
+
+
+def measure_in_process(path, repeat):
+    from PyQt6.QtCore import QDate
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    import Yandex
+    import windows
+
+    os.environ["MEDICINES_NOTIFY"] = ""
+    window = Yandex.MainWindow(database=path)
+    window.start_services()
+    # Отложенная загрузка окон и перенос журнала в архив, как при запуске.
+    app.processEvents()
+    repo = window.repo
+    schedule = windows.ScheduleWindow(window)
+    log = windows.LogWindow(window)
+    inventory = windows.InventoryWindow(window)
+    # Отчет о соблюдении режима за несколько лет по всем лекарствам.
+    adherence = windows.AdherenceWindow(window)
+    adherence.start_edit.setDate(QDate.currentDate().addYears(-ADHERENCE_YEARS))
+
+    results = {
+        "ScheduleWindow.update_table": measure(schedule.update_table, repeat),
+        "LogWindow.update_table": measure(log.update_table, repeat),
+    }
+    for label, text in SEARCHES.items():
+        results[f"ScheduleWindow.search_schedule[{label}]"] = measure(
+            lambda: schedule.search_schedule(text), repeat)
+        results[f"LogWindow.search_log[{label}]"] = measure(
+            lambda: log.search_log(text), repeat)
+        results[f"InventoryWindow.search_inventory[{label}]"] = measure(
+            lambda: inventory.search_inventory(text), repeat)
+    results[f"AdherenceWindow.update_table[{ADHERENCE_YEARS}y]"] = measure(
+        adherence.update_table, repeat)
+    results["NotificationTimer.check_notifications"] = measure(
+        window.notification_timer.check_notifications, repeat,
+        setup=lambda: add_due_doses(repo))
+    results["MainWindow.get_medicine_history[cold]"] = measure(
+        window.get_medicine_history, repeat, setup=repo.cache.invalidate)
+    results["MainWindow.get_medicine_history[warm]"] = measure(
+        window.get_medicine_history, repeat)
+    course_start = datetime.datetime.now() + datetime.timedelta(days=1)
+    stock_course(repo, COURSE_DOSES * repeat)
+    results[f"MedicineRepository.schedule_course[{COURSE_DOSES}]"] = measure(
+        lambda: repo.schedule_course("Курс", 1, course_start.strftime("%Y-%m-%d"),
+                                     "08:00", 60, count=COURSE_DOSES), repeat)
+
+    window.notification_timer.timer.stop()
+    window.notifier.stop(timeout=2)
+    repo.close()
+    return results
+
+
+def run_startup(path, repeat):
+    # Запуск измеряется в отдельном процессе на копии базы: программа
+    # открывает medicines.db из текущего каталога.
+    timings = []
+    profiles = []
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(path, os.path.join(directory, "medicines.db"))
+        try:
+            os.symlink(os.path.join(ROOT, "images"),
+                       os.path.join(directory, "images"))
+        except OSError:
+            pass
+        environment = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+                           MEDICINES_NOTIFY="")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, os.path.join(ROOT, "Yandex.py"),
+                 "--profile-startup"],
+                cwd=directory, env=environment, capture_output=True,
+                text=True, timeout=60)
+            timings.append((time.perf_counter() - started) * 1000)
+            profiles.append(parse_profile(completed.stderr))
+    result = {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+    if profiles and all(profiles):
+        result["steps_median_ms"] = {
+            step: round(statistics.median(profile[step] for profile in profiles), 3)
+            for step in profiles[0]
+        }
+    return result
+
+
+def parse_profile(output):
+    steps = {}
+    for line in output.splitlines():
+        match = re.match(r"^(.+?)\s+([\d.]+) мс\s+([\d.]+) мс$", line)
+        if match:
+            steps[match.group(1)] = float(match.group(3))
+    return steps
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Замеры производительности на синтетической базе")
+    parser.add_argument("--scale", choices=SCALES, default="medium")
+    parser.add_argument("--database",
+                        help="путь к базе, по умолчанию bench_data/<scale>.db")
+    parser.add_argument("--log-rows", type=int)
+    parser.add_argument("--scheduled", type=int)
+    parser.add_argument("--inventory", type=int)
+    parser.add_argument("--regenerate", action="store_true",
+                        help="создать базу заново, даже если она есть")
+    parser.add_argument("--generate-only", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--startup-repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv[1:])
+
+    sys.path.insert(0, ROOT)
+    size = dict(SCALES[args.scale])
+    for key in size:
+        if getattr(args, key) is not None:
+            size[key] = getattr(args, key)
+    path = args.database or os.path.join("bench_data", f"{args.scale}.db")
+
+    if args.regenerate or not os.path.exists(path):
+        started = time.perf_counter()
+        generate(path, **size)
+        print(f"База {path} создана за {time.perf_counter() - started:.1f} с",
+              file=sys.stderr)
+    if args.generate_only:
+        return 0
+
+    results = run_in_process(path, args.repeat)
+    results["startup"] = run_startup(path, args.startup_repeat)
+    report = {
+        "revision": git_revision(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "size": size,
+        "database_bytes": os.path.getsize(path),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    for name, result in results.items():
+        print(f"{name:<50}{result['median_ms']:10.2f} мс")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,246 @@
+import collections
+import csv
+import datetime
+import json
+import os
+import sys
+
+import adherence
+from repository import MedicineRepository, due_timestamp
+
+ImportReport = collections.namedtuple("ImportReport", "imported rejected")
+
+FIELDS = {
+    "inventory": ("name", "quantity"),
+    "schedule": ("name", "dosage", "date", "time"),
+    "log": ("name", "dosage", "date", "time", "received_time", "description"),
+}
+
+# Наибольшее целое, которое помещается в INTEGER SQLite.
+MAX_INT = 2 ** 63 - 1
+
+# Импорт и выгрузка работают с записями выбранного в репозитории пациента.
+EXPORT_QUERIES = {
+    "inventory": "SELECT name, quantity FROM inventory WHERE patient_id = ? ORDER BY name",
+    "schedule": "SELECT name, dosage, date, time FROM medicines WHERE patient_id = ? ORDER BY date, time",
+    "log": "SELECT name, dosage, date, time, received_time, description FROM medicines_log WHERE patient_id = ? ORDER BY date, time",
+}
+
+TABLES = {
+    "inventory": "inventory",
+    "schedule": "medicines",
+    "log": "medicines_log",
+}
+
+INSERT_QUERIES = {
+    "inventory": "INSERT INTO inventory (name, quantity, patient_id) VALUES (?, ?, ?) "
+                 "ON CONFLICT (patient_id, name) DO UPDATE SET quantity = quantity + excluded.quantity",
+    "schedule": "INSERT INTO medicines (name, dosage, date, time, due_at, patient_id) VALUES (?, ?, ?, ?, ?, ?)",
+    "log": "INSERT INTO medicines_log (name, dosage, date, time, received_time, description, patient_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+def is_json_lines(path):
+    return os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson", ".json")
+
+
+def read_records(path):
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        if is_json_lines(path):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, None, f"некорректный JSON: {e}"
+                    continue
+                yield line_number, record, None
+        else:
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record, None
+
+
+def text_field(record, field, required=True):
+    value = record.get(field)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"не заполнено поле {field}")
+    return value or None
+
+
+def positive_int(record, field, minimum=1, maximum=MAX_INT):
+    value = text_field(record, field)
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"поле {field} должно быть целым числом") from None
+    if number < minimum:
+        raise ValueError(f"поле {field} должно быть не меньше {minimum}")
+    if number > maximum:
+        raise ValueError(f"поле {field} должно быть не больше {maximum}")
+    return number
+
+
+def date_field(record, field, fmt):
+    value = text_field(record, field)
+    try:
+        datetime.datetime.strptime(value, fmt)
+    except ValueError:
+        raise ValueError(f"поле {field} не соответствует формату {fmt}") from None
+    return value
+
+
+def validate(kind, record):
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    name = text_field(record, "name")
+    if kind == "inventory":
+        return name, positive_int(record, "quantity", minimum=0)
+    dosage = positive_int(record, "dosage")
+    date = date_field(record, "date", "%Y-%m-%d")
+    time = date_field(record, "time", "%H:%M")
+    if kind == "schedule":
+        return name, dosage, date, time, due_timestamp(date, time)
+    received_time = text_field(record, "received_time", required=False)
+    if received_time is not None:
+        date_field(record, "received_time", "%Y-%m-%d %H:%M")
+    return (name, dosage, date, time, received_time,
+            text_field(record, "description", required=False))
+
+
+def check_stock(stock, debits, name, dosage):
+    if name not in stock:
+        return f"лекарства '{name}' нет в запасах"
+    remaining = stock[name] - debits[name]
+    if dosage > remaining:
+        return f"недостаточно лекарства '{name}': требуется {dosage}, осталось {remaining}"
+    return None
+
+
+def import_file(repo, kind, path):
+    rejected = []
+    debits = collections.Counter()
+    credits = collections.Counter()
+    stock = None
+    if kind == "schedule":
+        stock = dict(repo.cache.stock_levels())
+
+    def valid_rows():
+        for line_number, record, error in read_records(path):
+            if error is None:
+                try:
+                    row = validate(kind, record)
+                except ValueError as e:
+                    error = str(e)
+                else:
+                    if stock is not None:
+                        error = check_stock(stock, debits, row[0], row[1])
+            if error is not None:
+                rejected.append((line_number, error, record))
+                continue
+            if stock is not None:
+                debits[row[0]] += row[1]
+            elif kind == "inventory":
+                credits[row[0]] += row[1]
+            yield row + (repo.patient_id,)
+
+    # Строки читаются из файла по одной и сразу уходят в executemany,
+    # весь файл записывается одной транзакцией.
+    with repo.transaction() as conn:
+        last_log_id = repo.last_log_id()
+        imported = conn.executemany(INSERT_QUERIES[kind],
+                                    valid_rows()).rowcount
+        if kind == "log":
+            adherence.record(conn, "id > :last", {"last": last_log_id})
+        if kind == "schedule":
+            conn.executemany(
+                "UPDATE inventory SET quantity = quantity - ? WHERE patient_id = ? AND name = ?",
+                ((quantity, repo.patient_id, name)
+                 for name, quantity in debits.items()))
+        # Импорт пишет в таблицы в обход методов репозитория.
+        repo.cache.invalidate()
+        repo.changed(TABLES[kind])
+        if kind == "schedule":
+            repo.changed("inventory")
+        if kind != "log":
+            repo.refresh_patient_forecast()
+            # Изменения остатков попадают в журнал запасов одной записью
+            # на лекарство, и только для лекарств из файла.
+            credits.subtract(debits)
+            for name, delta in credits.items():
+                row = repo.query_one(
+                    "SELECT id FROM inventory WHERE patient_id = ? AND name = ?",
+                    (repo.patient_id, name))
+                if row is not None:
+                    repo.record_stock(row[0], repo.patient_id, delta, "import")
+    return ImportReport(imported, rejected)
+
+
+def write_rejected(report, path):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["line", "error", "record"])
+        for line_number, error, record in report.rejected:
+            writer.writerow([line_number, error,
+                             json.dumps(record, ensure_ascii=False)])
+
+
+def iter_export(repo, kind, batch_size=500):
+    cursor = repo.conn.execute(EXPORT_QUERIES[kind], (repo.patient_id,))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_file(repo, kind, path):
+    fields = FIELDS[kind]
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if is_json_lines(path):
+            for row in iter_export(repo, kind):
+                file.write(json.dumps(dict(zip(fields, row)),
+                                      ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            for row in iter_export(repo, kind):
+                writer.writerow(row)
+                count += 1
+    return count
+
+
+def main(argv):
+    if len(argv) not in (4, 5) or argv[1] not in ("import", "export") \
+            or argv[2] not in FIELDS \
+            or (len(argv) == 5 and not argv[4].isdigit()):
+        print("Использование: python bulk_io.py import|export "
+              "inventory|schedule|log <файл.csv|файл.jsonl> [id пациента]",
+              file=sys.stderr)
+        return 2
+    action, kind, path = argv[1:4]
+    repo = MedicineRepository()
+    if len(argv) == 5:
+        repo.set_patient(int(argv[4]))
+    try:
+        if action == "export":
+            print(f"Выгружено записей: {export_file(repo, kind, path)}")
+            return 0
+        report = import_file(repo, kind, path)
+        print(f"Загружено записей: {report.imported}, "
+              f"отклонено: {len(report.rejected)}")
+        if report.rejected:
+            report_path = path + ".rejected.csv"
+            write_rejected(report, report_path)
+            print(f"Отчет об отклоненных строках: {report_path}")
+        return 0
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,80 @@
+class InventoryCache:
+    def __init__(self, conn, patient_id=1):
+        self.conn = conn
+        self.patient_id = patient_id
+        self.stock = None
+        self.history = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def check(self):
+        # data_version меняется только после записи из другого соединения
+        # (второй процесс, фоновая служба), собственные записи его не трогают.
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            if self.version is not None:
+                self.invalidate()
+            self.version = version
+
+    def set_patient(self, patient_id):
+        if patient_id != self.patient_id:
+            self.patient_id = patient_id
+            self.invalidate()
+
+    def stock_levels(self):
+        self.check()
+        if self.stock is None:
+            self.misses += 1
+            self.stock = dict(self.conn.execute(
+                "SELECT name, quantity FROM inventory WHERE patient_id = ?",
+                (self.patient_id,)))
+        else:
+            self.hits += 1
+        return self.stock
+
+    def history_names(self):
+        self.check()
+        if self.history is None:
+            self.misses += 1
+            self.history = {row[0] for row in self.conn.execute(
+                "SELECT DISTINCT name FROM medicines WHERE patient_id = ? UNION SELECT DISTINCT name FROM medicines_log WHERE patient_id = ?",
+                (self.patient_id, self.patient_id))}
+        else:
+            self.hits += 1
+        return self.history
+
+    # Кэш хранит данные только выбранного пациента, изменения запасов
+    # остальных пациентов (например, из планировщика) пропускаются.
+    def set_stock(self, patient_id, name, quantity):
+        if self.stock is not None and patient_id == self.patient_id:
+            self.stock[name] = quantity
+
+    def adjust_stock(self, patient_id, name, delta):
+        if (self.stock is not None and patient_id == self.patient_id
+                and name in self.stock):
+            self.stock[name] += delta
+
+    def remove_stock(self, patient_id, name):
+        if self.stock is not None and patient_id == self.patient_id:
+            self.stock.pop(name, None)
+
+    def add_name(self, patient_id, name):
+        if self.history is not None and patient_id == self.patient_id:
+            self.history.add(name)
+
+    def invalidate(self):
+        if self.stock is not None or self.history is not None:
+            self.invalidations += 1
+        self.stock = None
+        self.history = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
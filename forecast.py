@@ -0,0 +1,98 @@
+import time
+
+# За сколько дней до того, как лекарство закончится, напоминать о покупке.
+REORDER_DAYS = 7
+
+# Прогноз по всем лекарствам выбранной части запасов одним запросом.
+# Лекарство заканчивается на первом запланированном приеме, после которого
+# остаток (свободный запас плюс уже списанные под приемы) не больше нуля.
+# Если запланированных приемов хватает, расход продолжается по правилам
+# повторения с момента, до которого они уже развернуты (или с начала курса).
+REFRESH = '''
+    WITH doses AS (
+        -- Пока свободный запас больше нуля, его хватает на все
+        -- запланированные приемы, накопительная сумма для них не нужна.
+        SELECT medicines.patient_id, medicines.name, medicines.due_at,
+               SUM(medicines.dosage) OVER (
+                   PARTITION BY medicines.patient_id, medicines.name
+                   ORDER BY medicines.due_at, medicines.id) AS used,
+               SUM(medicines.dosage) OVER (
+                   PARTITION BY medicines.patient_id, medicines.name) AS reserved
+        FROM (SELECT patient_id, name FROM inventory
+              WHERE {condition} AND quantity <= 0) AS empty
+        JOIN medicines ON medicines.patient_id = empty.patient_id
+            AND medicines.name = empty.name
+    ), depleted AS (
+        SELECT doses.patient_id, doses.name, MIN(doses.due_at) AS due_at
+        FROM doses JOIN inventory
+            ON inventory.patient_id = doses.patient_id
+            AND inventory.name = doses.name
+        WHERE doses.used >= inventory.quantity + doses.reserved
+        GROUP BY doses.patient_id, doses.name
+    ), rates AS (
+        SELECT patient_id, name,
+               SUM(dosage * 1.0 / interval_minutes) AS per_minute,
+               CAST(strftime('%s', MAX(COALESCE(
+                   expanded_until, start_date || ' ' || start_time)), 'utc')
+                   AS INTEGER) AS expanded_at,
+               CASE WHEN COUNT(end_date) = COUNT(*) THEN
+                   CAST(strftime('%s', MAX(end_date) || ' 23:59', 'utc') AS INTEGER)
+               END AS ends_at
+        FROM medicine_rules
+        WHERE {condition} AND interval_minutes > 0
+            AND (end_date IS NULL
+                 OR end_date >= date(:now, 'unixepoch', 'localtime'))
+        GROUP BY patient_id, name
+    ), forecast AS (
+        SELECT inventory.patient_id, inventory.name,
+               COALESCE(
+                   depleted.due_at,
+                   CAST(MAX(COALESCE(rates.expanded_at, :now), :now)
+                        + MAX(inventory.quantity, 0) / rates.per_minute * 60
+                        AS INTEGER)) AS runs_out_at,
+               rates.ends_at
+        FROM (SELECT * FROM inventory WHERE {condition}) AS inventory
+        LEFT JOIN depleted ON depleted.patient_id = inventory.patient_id
+            AND depleted.name = inventory.name
+        LEFT JOIN rates ON rates.patient_id = inventory.patient_id
+            AND rates.name = inventory.name
+    )
+    INSERT INTO stock_forecast (patient_id, name, runs_out_at, reorder_at)
+    SELECT patient_id, name, runs_out_at, runs_out_at - :lead
+    FROM (SELECT patient_id, name,
+                 CASE WHEN ends_at IS NULL OR runs_out_at <= ends_at
+                      THEN runs_out_at END AS runs_out_at
+          FROM forecast)
+    WHERE true
+    ON CONFLICT (patient_id, name) DO UPDATE SET
+        runs_out_at = excluded.runs_out_at,
+        reorder_at = excluded.reorder_at
+'''
+
+REMOVE_ORPHANS = '''
+    DELETE FROM stock_forecast
+    WHERE {condition} AND NOT EXISTS (
+        SELECT 1 FROM inventory
+        WHERE inventory.patient_id = stock_forecast.patient_id
+            AND inventory.name = stock_forecast.name)
+'''
+
+CONDITIONS = {
+    (True, True): "patient_id = :patient_id AND name = :name",
+    (True, False): "patient_id = :patient_id",
+    (False, False): "1",
+}
+
+
+def refresh(conn, patient_id=None, name=None, now=None):
+    # Пересчитывается только указанное лекарство (или пациент), остальные
+    # строки прогноза не трогаются.
+    condition = CONDITIONS[patient_id is not None, name is not None]
+    params = {
+        "patient_id": patient_id,
+        "name": name,
+        "now": int(time.time()) if now is None else now,
+        "lead": REORDER_DAYS * 24 * 60 * 60,
+    }
+    conn.execute(REFRESH.format(condition=condition), params)
+    conn.execute(REMOVE_ORPHANS.format(condition=condition), params)
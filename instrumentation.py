@@ -0,0 +1,270 @@
+import atexit
+import collections
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Профилирование включается переменной окружения, в ней же указывается
+# файл, куда статистика записывается при выходе из программы.
+PROFILE_VARIABLE = "MEDICINES_SQL_PROFILE"
+MAX_SAMPLES = 1000
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+WHITESPACE = re.compile(r"\s+")
+SCAN = re.compile(r"^SCAN (\S+)")
+# Подзапросы и CTE, которые план выполняет как отдельные таблицы.
+DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+
+
+def normalize(sql):
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class StatementStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        # Каждый замер хранится в списке из одного элемента, чтобы время
+        # выборки строк дописывалось к своему выполнению запроса.
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)
+        self.plan = None
+        self.full_scan = False
+
+    def as_dict(self):
+        samples = [sample[0] for sample in self.samples]
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p95_ms": round(percentile(samples, 0.95), 3),
+            "full_scan": self.full_scan,
+            "plan": self.plan,
+        }
+
+
+class QueryProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.traced = 0
+        self.exit_hook = False
+
+    def statement(self, sql):
+        key = normalize(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            return stats
+
+    def record(self, stats, elapsed_ms):
+        sample = [elapsed_ms]
+        with self.lock:
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.samples.append(sample)
+        return sample
+
+    def record_fetch(self, stats, sample, elapsed_ms, rows):
+        with self.lock:
+            stats.total_ms += elapsed_ms
+            stats.rows += rows
+            if sample is not None:
+                sample[0] += elapsed_ms
+
+    def trace(self, statement):
+        # SQLite сообщает и о запросах, которые идут мимо курсора:
+        # тела executescript и команды триггеров.
+        with self.lock:
+            self.traced += 1
+
+    def snapshot(self):
+        with self.lock:
+            statements = [stats.as_dict() for stats in self.statements.values()]
+            traced = self.traced
+        statements.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "traced_statements": traced,
+            "full_scans": sum(item["full_scan"] for item in statements),
+            "statements": statements,
+        }
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.traced = 0
+
+
+profiler = QueryProfiler()
+
+
+def explain(conn, stats, sql, params):
+    if stats.plan is not None:
+        return
+    if not normalize(sql).upper().startswith(EXPLAINED):
+        stats.plan = []
+        return
+    try:
+        cursor = sqlite3.Cursor(conn)
+        plan = [row[3] for row in cursor.execute(
+            "EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error as e:
+        plan = [f"EXPLAIN QUERY PLAN: {e}"]
+    stats.plan = plan
+    stats.full_scan = any(scans_table(conn, sql, plan, detail)
+                          for detail in plan)
+
+
+def base_tables(conn):
+    cursor = sqlite3.Cursor(conn)
+    tables = set()
+    for _, schema, _ in cursor.execute("PRAGMA database_list").fetchall():
+        tables.update(name.lower() for (name,) in cursor.execute(
+            f'SELECT name FROM "{schema}".sqlite_master WHERE type = \'table\''))
+    return tables
+
+
+def scans_table(conn, sql, plan, detail):
+    # «SCAN t» без индекса означает полный проход по таблице. Проход по
+    # виртуальной FTS-таблице, подзапросу «(subquery-N)» или CTE к этому
+    # не относится, поэтому имя сверяется с таблицами из sqlite_master.
+    match = SCAN.match(detail)
+    if match is None or "INDEX" in detail or "VIRTUAL TABLE" in detail:
+        return False
+    derived = {DERIVED.match(line).group(1).lower()
+               for line in plan if DERIVED.match(line)}
+    name = match.group(1).split(".")[-1].lower()
+    if name.startswith("(") or name in derived:
+        return False
+    tables = base_tables(conn)
+    if name in tables:
+        return True
+    # В плане вместо таблицы указан ее псевдоним: «FROM medicines m».
+    alias = re.search(rf"([\w.]+)\s+(?:AS\s+)?{re.escape(name)}\b", sql,
+                      re.IGNORECASE)
+    if alias is None:
+        return False
+    name = alias.group(1).split(".")[-1].lower()
+    return name in tables and name not in derived
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    stats = None
+    sample = None
+
+    def execute(self, sql, parameters=()):
+        self.stats = profiler.statement(sql)
+        explain(self.connection, self.stats, sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.sample = profiler.record(
+                self.stats, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.stats = profiler.statement(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.sample = profiler.record(
+                self.stats, (time.perf_counter() - started) * 1000)
+
+    def executescript(self, sql_script):
+        self.stats = profiler.statement(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self.sample = profiler.record(
+                self.stats, (time.perf_counter() - started) * 1000)
+
+    def fetched(self, started, rows):
+        if self.stats is not None:
+            profiler.record_fetch(self.stats, self.sample,
+                                  (time.perf_counter() - started) * 1000, rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(started, 0)
+            raise
+        self.fetched(started, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(profiler.trace)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def profile_path():
+    return os.environ.get(PROFILE_VARIABLE) or None
+
+
+def dump_on_exit():
+    try:
+        profiler.dump(profile_path())
+    except OSError:
+        pass
+
+
+def connection_factory():
+    if not profile_path():
+        return sqlite3.Connection
+    if not profiler.exit_hook:
+        profiler.exit_hook = True
+        atexit.register(dump_on_exit)
+    return ProfiledConnection
@@ -0,0 +1,433 @@
+import sqlite3
+import time
+
+
+def create_tables(cursor):
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS medicines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            dosage INTEGER,
+            date TEXT,
+            time TEXT
+          )
+        ''')
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            quantity INTEGER
+          )
+        ''')
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS medicines_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            dosage INTEGER,
+            date TEXT,
+            time TEXT,
+            received_time TEXT,
+            description TEXT
+          )
+        ''')
+
+
+def add_indexes(cursor):
+    # Старые базы могли накопить дубликаты названий в запасах:
+    # количество сливается в самую раннюю запись, остальные удаляются.
+    cursor.execute('''
+          UPDATE inventory
+          SET quantity = (SELECT SUM(quantity) FROM inventory AS duplicate
+                          WHERE duplicate.name = inventory.name)
+          WHERE id IN (SELECT MIN(id) FROM inventory
+                       GROUP BY name HAVING COUNT(*) > 1)
+        ''')
+    cursor.execute('''
+          DELETE FROM inventory
+          WHERE id NOT IN (SELECT MIN(id) FROM inventory GROUP BY name)
+        ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_date_time ON medicines (date, time)")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS inventory_name ON inventory (name)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_log_name_date ON medicines_log (name, date)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_log_date_time ON medicines_log (date, time)")
+
+
+LOG_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS medicines_log_patient_name_date ON medicines_log (patient_id, name, date)",
+    "CREATE INDEX IF NOT EXISTS medicines_log_patient_date_time ON medicines_log (patient_id, date, time)",
+)
+
+SEARCH_INDEXES = {
+    "medicines": ("name", "dosage", "date", "time"),
+    "inventory": ("name",),
+    "medicines_log": ("name",),
+}
+
+
+def search_index_statements(table, columns):
+    fts = f"{table}_fts"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f'''
+          CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list},
+            content='{table}', content_rowid='id', tokenize='trigram'
+          )
+        ''',
+        f'''
+          CREATE TRIGGER IF NOT EXISTS {table}_fts_insert
+          AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list})
+            VALUES (new.id, {new_values});
+          END
+        ''',
+        f'''
+          CREATE TRIGGER IF NOT EXISTS {table}_fts_delete
+          AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list})
+            VALUES ('delete', old.id, {old_values});
+          END
+        ''',
+        f'''
+          CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+          AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list})
+            VALUES (new.id, {new_values});
+          END
+        ''',
+    ]
+
+
+def add_search_index(cursor):
+    # Внешние FTS5-таблицы хранят только триграммный индекс, сами строки
+    # остаются в исходных таблицах и синхронизируются триггерами.
+    for table, columns in SEARCH_INDEXES.items():
+        for statement in search_index_statements(table, columns):
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def add_recurrence_rules(cursor):
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS medicine_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            dosage INTEGER,
+            start_date TEXT,
+            start_time TEXT,
+            interval_minutes INTEGER,
+            end_date TEXT,
+            expanded_until TEXT
+          )
+        ''')
+    cursor.execute(
+        "ALTER TABLE medicines ADD COLUMN rule_id INTEGER REFERENCES medicine_rules (id)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_rule ON medicines (rule_id)")
+
+
+def add_due_at(cursor):
+    # Момент приема хранится в секундах Unix: сравнение не ломается при
+    # переходе через полночь и переводе часов, date и time нужны для показа.
+    cursor.execute("ALTER TABLE medicines ADD COLUMN due_at INTEGER")
+    cursor.execute('''
+          UPDATE medicines
+          SET due_at = CAST(strftime('%s', date || ' ' || time, 'utc') AS INTEGER)
+        ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_due_at ON medicines (due_at)")
+
+
+def add_patients(cursor):
+    # Все прежние записи принадлежат пациенту по умолчанию с id = 1.
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+          )
+        ''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO patients (id, name) VALUES (1, 'Пациент 1')")
+    for table in ("medicines", "inventory", "medicines_log", "medicine_rules"):
+        cursor.execute(
+            f"ALTER TABLE {table} ADD COLUMN patient_id INTEGER NOT NULL DEFAULT 1 REFERENCES patients (id)")
+    # Индексы начинаются с patient_id, чтобы окна одного пациента
+    # не просматривали записи остальных.
+    cursor.execute("DROP INDEX IF EXISTS medicines_date_time")
+    cursor.execute("DROP INDEX IF EXISTS inventory_name")
+    cursor.execute("DROP INDEX IF EXISTS medicines_log_name_date")
+    cursor.execute("DROP INDEX IF EXISTS medicines_log_date_time")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_patient_date_time ON medicines (patient_id, date, time)")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS inventory_patient_name ON inventory (patient_id, name)")
+    for statement in LOG_INDEXES:
+        cursor.execute(statement)
+
+
+# Первый расчет прогноза в том виде, в каком он был в версии 7 схемы.
+# Миграция не вызывает forecast.refresh: запрос в нем меняется вместе со
+# схемой и может обращаться к столбцам, которых в этой версии еще нет.
+STOCK_FORECAST_BACKFILL = '''
+    WITH doses AS (
+        SELECT medicines.patient_id, medicines.name, medicines.due_at,
+               SUM(medicines.dosage) OVER (
+                   PARTITION BY medicines.patient_id, medicines.name
+                   ORDER BY medicines.due_at, medicines.id) AS used,
+               SUM(medicines.dosage) OVER (
+                   PARTITION BY medicines.patient_id, medicines.name) AS reserved
+        FROM (SELECT patient_id, name FROM inventory WHERE quantity <= 0) AS empty
+        JOIN medicines ON medicines.patient_id = empty.patient_id
+            AND medicines.name = empty.name
+    ), depleted AS (
+        SELECT doses.patient_id, doses.name, MIN(doses.due_at) AS due_at
+        FROM doses JOIN inventory
+            ON inventory.patient_id = doses.patient_id
+            AND inventory.name = doses.name
+        WHERE doses.used >= inventory.quantity + doses.reserved
+        GROUP BY doses.patient_id, doses.name
+    ), rates AS (
+        SELECT patient_id, name,
+               SUM(dosage * 1.0 / interval_minutes) AS per_minute,
+               CAST(strftime('%s', MAX(COALESCE(
+                   expanded_until, start_date || ' ' || start_time)), 'utc')
+                   AS INTEGER) AS expanded_at,
+               CASE WHEN COUNT(end_date) = COUNT(*) THEN
+                   CAST(strftime('%s', MAX(end_date) || ' 23:59', 'utc') AS INTEGER)
+               END AS ends_at
+        FROM medicine_rules
+        WHERE interval_minutes > 0
+            AND (end_date IS NULL
+                 OR end_date >= date(:now, 'unixepoch', 'localtime'))
+        GROUP BY patient_id, name
+    ), forecast AS (
+        SELECT inventory.patient_id, inventory.name,
+               COALESCE(
+                   depleted.due_at,
+                   CAST(MAX(COALESCE(rates.expanded_at, :now), :now)
+                        + MAX(inventory.quantity, 0) / rates.per_minute * 60
+                        AS INTEGER)) AS runs_out_at,
+               rates.ends_at
+        FROM inventory
+        LEFT JOIN depleted ON depleted.patient_id = inventory.patient_id
+            AND depleted.name = inventory.name
+        LEFT JOIN rates ON rates.patient_id = inventory.patient_id
+            AND rates.name = inventory.name
+    )
+    INSERT OR REPLACE INTO stock_forecast (patient_id, name, runs_out_at, reorder_at)
+    SELECT patient_id, name, runs_out_at, runs_out_at - 7 * 24 * 60 * 60
+    FROM (SELECT patient_id, name,
+                 CASE WHEN ends_at IS NULL OR runs_out_at <= ends_at
+                      THEN runs_out_at END AS runs_out_at
+          FROM forecast)
+'''
+
+
+def add_stock_forecast(cursor):
+    # Прогноз хранится по строке на лекарство в запасах и пересчитывается
+    # репозиторием только для тех лекарств, которые затронула запись.
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS stock_forecast (
+            patient_id INTEGER NOT NULL REFERENCES patients (id),
+            name TEXT NOT NULL,
+            runs_out_at INTEGER,
+            reorder_at INTEGER,
+            notified_on TEXT,
+            PRIMARY KEY (patient_id, name)
+          )
+        ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS stock_forecast_reorder_at ON stock_forecast (reorder_at)")
+    # Накопительная сумма по приемам одного лекарства читается из индекса
+    # уже в порядке due_at, без сортировки.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicines_patient_name_due_at ON medicines (patient_id, name, due_at)")
+    cursor.execute('''
+          CREATE VIEW IF NOT EXISTS inventory_forecast AS
+          SELECT inventory.id, inventory.patient_id, inventory.name,
+                 inventory.quantity,
+                 date(stock_forecast.runs_out_at, 'unixepoch', 'localtime') AS runs_out_on,
+                 date(stock_forecast.reorder_at, 'unixepoch', 'localtime') AS reorder_on
+          FROM inventory
+          LEFT JOIN stock_forecast ON stock_forecast.patient_id = inventory.patient_id
+              AND stock_forecast.name = inventory.name
+        ''')
+    cursor.execute(STOCK_FORECAST_BACKFILL,
+                   {"now": int(time.time())})
+
+
+def add_stock_ledger(cursor):
+    # Журнал запасов только дополняется: каждое изменение quantity
+    # записывается отдельной строкой в той же транзакции.
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS stock_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER NOT NULL,
+            patient_id INTEGER NOT NULL DEFAULT 1 REFERENCES patients (id),
+            delta INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+          )
+        ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS stock_ledger_inventory_created_at ON stock_ledger (inventory_id, created_at)")
+    # Снимок остатка делается через каждые SNAPSHOT_INTERVAL записей
+    # журнала, остаток на любой момент — снимок плюс записи после него.
+    cursor.execute('''
+          CREATE TABLE IF NOT EXISTS stock_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER NOT NULL,
+            ledger_id INTEGER NOT NULL,
+            balance INTEGER NOT NULL,
+            taken_at INTEGER NOT NULL
+          )
+        ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS stock_snapshots_inventory_taken_at ON stock_snapshots (inventory_id, taken_at, ledger_id)")
+    cursor.execute(
+        "ALTER TABLE inventory ADD COLUMN ledger_pending INTEGER NOT NULL DEFAULT 0")
+    cursor.execute('''
+          CREATE VIEW IF NOT EXISTS stock_history AS
+          SELECT id, inventory_id, created_at,
+                 datetime(created_at, 'unixepoch', 'localtime') AS created,
+                 CASE kind
+                     WHEN 'opening' THEN 'Начальный остаток'
+                     WHEN 'restock' THEN 'Пополнение'
+                     WHEN 'reserve' THEN 'Списание под прием'
+                     WHEN 'release' THEN 'Возврат при отмене'
+                     WHEN 'correction' THEN 'Исправление'
+                     WHEN 'import' THEN 'Импорт'
+                     ELSE kind
+                 END AS operation,
+                 CASE WHEN delta > 0 THEN '+' || delta ELSE delta END AS change
+          FROM stock_ledger
+        ''')
+    # Остатки, накопленные до появления журнала, становятся его первыми
+    # записями.
+    cursor.execute('''
+          INSERT INTO stock_ledger (inventory_id, patient_id, delta, kind, created_at)
+          SELECT id, patient_id, quantity, 'opening', CAST(strftime('%s', 'now') AS INTEGER)
+          FROM inventory WHERE quantity != 0
+        ''')
+    cursor.execute(
+        "UPDATE inventory SET ledger_pending = 1 WHERE quantity != 0")
+
+
+def add_log_delay(cursor):
+    # На сколько секунд запись в журнал отстала от времени приема, например
+    # если программа была закрыта. У записей, внесенных вручную, пусто.
+    cursor.execute(
+        "ALTER TABLE medicines_log ADD COLUMN delay_seconds INTEGER")
+
+
+# Интервалы опоздания и первое заполнение сводок в том виде, в каком они
+# были в версии 10 схемы, независимо от текущего модуля adherence.
+ADHERENCE_BUCKETS = (0, 1, 2, 5, 10, 15, 30, 60, 120, 240, 480, 720, 1440, 2880)
+ADHERENCE_COLUMNS = tuple(f"late_{minutes}" for minutes in ADHERENCE_BUCKETS)
+ADHERENCE_PERIODS = {
+    "adherence_daily": "date",
+    "adherence_monthly": "substr(date, 1, 7)",
+}
+
+
+def adherence_bucket(index):
+    low = ADHERENCE_BUCKETS[index] * 60
+    if index + 1 == len(ADHERENCE_BUCKETS):
+        return f"COUNT(CASE WHEN lateness >= {low} THEN 1 END)"
+    high = ADHERENCE_BUCKETS[index + 1] * 60
+    return f"COUNT(CASE WHEN lateness >= {low} AND lateness < {high} THEN 1 END)"
+
+
+ADHERENCE_BACKFILL = f'''
+    INSERT INTO {{table}} (patient_id, name, period, scheduled, taken, on_time,
+                          {", ".join(ADHERENCE_COLUMNS)})
+    SELECT patient_id, name, {{period}}, COUNT(*), COUNT(lateness),
+           COUNT(CASE WHEN lateness < 15 * 60 THEN 1 END),
+           {", ".join(adherence_bucket(index)
+                      for index in range(len(ADHERENCE_BUCKETS)))}
+    FROM (SELECT patient_id, name, date,
+                 MAX(COALESCE(delay_seconds,
+                              strftime('%s', received_time)
+                              - strftime('%s', date || ' ' || time)), 0)
+                     AS lateness
+          FROM medicines_log)
+    GROUP BY patient_id, name, {{period}}
+'''
+
+
+def add_adherence(cursor):
+    # Сводки журнала по лекарствам за день и за месяц: отчет о соблюдении
+    # режима складывает их, а не перебирает весь журнал. Строки лежат
+    # в порядке первичного ключа, группировка по лекарству идет без
+    # сортировки.
+    buckets = ",\n".join(f"            {column} INTEGER NOT NULL DEFAULT 0"
+                          for column in ADHERENCE_COLUMNS)
+    for table, period in ADHERENCE_PERIODS.items():
+        cursor.execute(f'''
+          CREATE TABLE IF NOT EXISTS {table} (
+            patient_id INTEGER NOT NULL REFERENCES patients (id),
+            name TEXT NOT NULL,
+            period TEXT NOT NULL,
+            scheduled INTEGER NOT NULL,
+            taken INTEGER NOT NULL,
+            on_time INTEGER NOT NULL,
+{buckets},
+            PRIMARY KEY (patient_id, name, period)
+          ) WITHOUT ROWID
+        ''')
+        cursor.execute(ADHERENCE_BACKFILL.format(table=table, period=period))
+
+
+def add_rule_indexes(cursor):
+    # Прогноз запаса читает правила одного лекарства или пациента, а
+    # проверка перед развертыванием — правила, развернутые не до горизонта.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicine_rules_patient_name ON medicine_rules (patient_id, name)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS medicine_rules_expanded_until ON medicine_rules (expanded_until)")
+
+
+MIGRATIONS = [
+    create_tables,
+    add_indexes,
+    add_search_index,
+    add_recurrence_rules,
+    add_due_at,
+    add_patients,
+    add_stock_forecast,
+    add_stock_ledger,
+    add_log_delay,
+    add_adherence,
+    add_rule_indexes,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    if version > len(MIGRATIONS):
+        raise sqlite3.DatabaseError(
+            f"Версия базы данных {version} новее, чем поддерживает приложение")
+
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            MIGRATIONS[number - 1](cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
@@ -0,0 +1,182 @@
+import datetime
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+APP_NAME = "MyMedicineApp"
+APP_ICON = "images/icon.ico"
+
+
+class PlyerBackend:
+    name = "plyer"
+    send_timeout = 5
+
+    def send(self, title, message):
+        from plyer import notification
+
+        notification.notify(
+            title=title,
+            message=message,
+            app_name=APP_NAME,
+            timeout=10,
+            app_icon=APP_ICON,
+        )
+
+
+class FileBackend:
+    name = "file"
+    send_timeout = 2
+
+    def __init__(self, path="notifications.log"):
+        self.path = path
+
+    def send(self, title, message):
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "title": title,
+            "message": message,
+        }
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class StdoutBackend:
+    name = "stdout"
+    send_timeout = 1
+
+    def send(self, title, message):
+        print(f"{title}: {message}", flush=True)
+
+
+class SocketBackend:
+    name = "socket"
+    send_timeout = 1
+
+    def __init__(self, host="127.0.0.1", port=47800):
+        self.address = (host, port)
+
+    def send(self, title, message):
+        payload = json.dumps({"title": title, "message": message},
+                             ensure_ascii=False).encode("utf-8")
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.send_timeout)
+            sock.sendto(payload, self.address)
+
+
+BACKENDS = {
+    "plyer": PlyerBackend,
+    "file": FileBackend,
+    "stdout": StdoutBackend,
+    "socket": SocketBackend,
+}
+
+
+def create_backends(names):
+    backends = []
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if name not in BACKENDS:
+            raise ValueError(f"Неизвестный способ уведомления: {name}")
+        backends.append(BACKENDS[name]())
+    return backends
+
+
+class SendCall(threading.Thread):
+    # Отдельный поток-демон на каждый вызов send: зависший вызов нельзя
+    # прервать, но он не задерживает ни другие способы, ни выход программы.
+    def __init__(self, backend, title, message):
+        super().__init__(name=f"notify-{backend.name}-send", daemon=True)
+        self.backend = backend
+        self.title = title
+        self.message = message
+        self.error = None
+
+    def run(self):
+        try:
+            self.backend.send(self.title, self.message)
+        except Exception as e:
+            self.error = e
+
+
+class BackendWorker:
+    # У каждого способа своя очередь и свой поток: зависший D-Bus не
+    # задерживает запись в файл или отправку в сокет.
+    def __init__(self, backend, retries, retry_delay):
+        self.backend = backend
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue()
+        # Вызов, который не ответил вовремя и, возможно, еще выполняется.
+        self.hung = None
+        self.thread = threading.Thread(target=self.run,
+                                       name=f"notify-{backend.name}",
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.deliver(*item)
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, title, message):
+        timeout = self.backend.send_timeout
+        for attempt in range(self.retries + 1):
+            if self.hung is not None and self.hung.is_alive():
+                # Повтор не встает в очередь за зависшим вызовом: пока тот
+                # не завершился, способ считается недоступным.
+                error = f"предыдущая отправка не завершилась за {timeout} с"
+            else:
+                self.hung = None
+                call = SendCall(self.backend, title, message)
+                call.start()
+                call.join(timeout)
+                if call.is_alive():
+                    self.hung = call
+                    error = f"нет ответа за {timeout} с"
+                elif call.error is None:
+                    return True
+                else:
+                    error = call.error
+            if attempt < self.retries:
+                time.sleep(self.retry_delay * 2 ** attempt)
+        print(f"Не удалось отправить уведомление через {self.backend.name}: {error}",
+              file=sys.stderr)
+        return False
+
+
+class NotificationDispatcher:
+    def __init__(self, backends=None, retries=2, retry_delay=0.5):
+        self.backends = backends if backends is not None else [PlyerBackend()]
+        self.workers = [BackendWorker(backend, retries, retry_delay)
+                        for backend in self.backends]
+
+    @classmethod
+    def from_environment(cls):
+        names = os.environ.get("MEDICINES_NOTIFY", "plyer").split(",")
+        return cls(create_backends(names))
+
+    def notify(self, title, message):
+        # Сообщение сразу попадает в очереди всех способов, никто не ждет
+        # доставки через предыдущий.
+        for worker in self.workers:
+            worker.queue.put((title, message))
+
+    def stop(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self.workers:
+            worker.queue.put(None)
+        for worker in self.workers:
+            remaining = None if deadline is None else max(
+                deadline - time.monotonic(), 0)
+            worker.thread.join(remaining)
@@ -0,0 +1,62 @@
+import asyncio
+import signal
+import sqlite3
+import sys
+
+import scheduler
+from notifier import NotificationDispatcher
+from repository import DATABASE, MedicineRepository
+
+# Приемы, добавленные из окна программы, замечаются не позже чем через
+# POLL_INTERVAL секунд: проверка due_at идет по индексу и почти ничего не стоит.
+POLL_INTERVAL = 30
+
+
+async def run(repo, notifier, stop):
+    while not stop.is_set():
+        try:
+            scheduler.deliver_due(repo, notifier)
+            delay = scheduler.seconds_until_next(repo, POLL_INTERVAL)
+        except sqlite3.Error as e:
+            # База могла быть занята программой или недоступна: служба не
+            # останавливается, а повторяет проверку через POLL_INTERVAL.
+            print(f"Ошибка проверки напоминаний: {e}", file=sys.stderr)
+            delay = POLL_INTERVAL
+        try:
+            await asyncio.wait_for(stop.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def serve(repo, notifier):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, AttributeError):
+            # В Windows обработчики сигналов в цикле asyncio недоступны,
+            # служба останавливается по Ctrl+C.
+            pass
+    await run(repo, notifier, stop)
+
+
+def main(argv):
+    if len(argv) > 2:
+        print("Использование: python reminder_daemon.py [medicines.db]",
+              file=sys.stderr)
+        return 2
+    repo = MedicineRepository(argv[1] if len(argv) == 2 else DATABASE)
+    notifier = NotificationDispatcher.from_environment()
+    try:
+        asyncio.run(serve(repo, notifier))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        notifier.stop(timeout=2)
+        repo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
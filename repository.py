@@ -0,0 +1,688 @@
+import contextlib
+import datetime
+import sqlite3
+import time
+
+import adherence
+import forecast
+import instrumentation
+import migrations
+from cache import InventoryCache
+
+DATABASE = "medicines.db"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+EXPANSION_DAYS = 7
+DEFAULT_PATIENT = 1
+# Через сколько записей журнала запасов делать снимок остатка.
+SNAPSHOT_INTERVAL = 100
+# Правила, у которых еще есть что разворачивать до горизонта. Завершенное
+# правило хранит в expanded_until конец своего последнего дня.
+RULES_PENDING = '''
+    WHERE (expanded_until IS NULL OR expanded_until < :horizon)
+        AND (end_date IS NULL OR expanded_until IS NULL
+             OR expanded_until < end_date || ' 23:59')
+'''
+MAX_COURSE_DOSES = 10_000
+
+# auto_vacuum действует только в новой базе и задается раньше режима WAL,
+# который создает файл. В старой базе для него нужен полный VACUUM, и она
+# остается как есть: место после переноса журнала в архив там не
+# освобождается, зато запись не блокируется на время перезаписи файла.
+PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8192",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def due_timestamp(date, time):
+    # Наивное время трактуется как местное, timestamp() учитывает летнее время.
+    return int(datetime.datetime.strptime(
+        f"{date} {time}", DATETIME_FORMAT).timestamp())
+
+
+def casefold_text(value):
+    return None if value is None else str(value).casefold()
+
+
+def search_filter(table, text, schemas=("main",)):
+    text = text.strip()
+    if not text:
+        return "", ()
+    columns = migrations.SEARCH_INDEXES[table]
+    if len(text) >= 3:
+        phrase = '"' + text.replace('"', '""') + '"'
+        subqueries = " UNION ALL ".join(
+            f"SELECT rowid FROM {schema}.{table}_fts WHERE {table}_fts MATCH ?"
+            for schema in schemas)
+        return f"id IN ({subqueries})", (phrase,) * len(schemas)
+    # Триграммный индекс не ищет по строкам короче трёх символов, такие
+    # запросы проверяются напрямую с учётом регистра кириллицы.
+    return (" OR ".join(f"instr(casefold({column}), ?)" for column in columns),
+            (text.casefold(),) * len(columns))
+
+
+def connect(database=DATABASE, check_same_thread=True, read_only=False):
+    conn = sqlite3.connect(database, isolation_level=None,
+                           cached_statements=256,
+                           check_same_thread=check_same_thread,
+                           factory=instrumentation.connection_factory())
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    conn.create_function("casefold", 1, casefold_text, deterministic=True)
+    return conn
+
+
+class MedicineRepository:
+    def __init__(self, database=DATABASE, check_same_thread=True):
+        self.database = database
+        self.conn = connect(database, check_same_thread)
+        self.depth = 0
+        # Лекарства, прогноз запаса которых нужно пересчитать при commit.
+        self.stale_forecasts = set()
+        # Изменения текущей транзакции: таблица -> id строк или None, если
+        # строки неизвестны. После commit они рассылаются подписчикам.
+        self.changes = {}
+        self.listeners = []
+        migrations.migrate(self.conn)
+        self.patient_id = DEFAULT_PATIENT
+        self.cache = InventoryCache(self.conn, self.patient_id)
+
+    def close(self):
+        self.conn.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Вложенные вызовы присоединяются к внешней транзакции, поэтому
+        # составные операции фиксируются одним commit.
+        if self.depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self.depth += 1
+        try:
+            yield self.conn
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.execute("ROLLBACK")
+                # Кэш уже мог получить изменения отмененной транзакции.
+                self.cache.invalidate()
+                self.stale_forecasts.clear()
+                self.changes = {}
+            raise
+        else:
+            self.depth -= 1
+            if self.depth == 0:
+                try:
+                    self.refresh_forecasts()
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    self.cache.invalidate()
+                    self.changes = {}
+                    raise
+                self.conn.execute("COMMIT")
+                self.publish()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def changed(self, table, *ids):
+        if not ids:
+            self.changes[table] = None
+        elif self.changes.get(table, ()) is not None:
+            self.changes.setdefault(table, set()).update(ids)
+
+    def publish(self):
+        changes, self.changes = self.changes, {}
+        if changes:
+            for listener in list(self.listeners):
+                listener(changes)
+
+    def query_one(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def patients(self):
+        return self.query_all("SELECT id, name FROM patients ORDER BY name")
+
+    def add_patient(self, name):
+        with self.transaction() as conn:
+            patient_id = conn.execute(
+                "INSERT INTO patients (name) VALUES (?)", (name,)).lastrowid
+            self.changed("patients", patient_id)
+        return patient_id
+
+    def set_patient(self, patient_id):
+        # Окна, кэш и новые записи относятся к выбранному пациенту,
+        # планировщик по-прежнему обслуживает всех.
+        self.patient_id = patient_id
+        self.cache.set_patient(patient_id)
+
+    def patient_scope(self):
+        return "patient_id = ?", (self.patient_id,)
+
+    def forecast_changed(self, patient_id, name):
+        self.stale_forecasts.add((patient_id, name))
+
+    def refresh_forecasts(self):
+        # Одна операция пересчитывает прогноз каждого затронутого лекарства
+        # один раз, даже если меняла его запас несколько раз.
+        stale, self.stale_forecasts = self.stale_forecasts, set()
+        for patient_id, name in stale:
+            forecast.refresh(self.conn, patient_id, name)
+            row = self.query_one(
+                "SELECT id FROM inventory WHERE patient_id = ? AND name = ?",
+                (patient_id, name))
+            if row is not None:
+                self.changed("inventory", row[0])
+
+    def refresh_patient_forecast(self):
+        with self.transaction() as conn:
+            forecast.refresh(conn, self.patient_id)
+            self.changed("inventory")
+
+    def stock_forecast(self):
+        return self.query_all(
+            "SELECT name, quantity, runs_out_on, reorder_on FROM inventory_forecast WHERE patient_id = ? ORDER BY name",
+            (self.patient_id,))
+
+    def reorder_due(self, now):
+        return self.query_all(
+            "SELECT stock_forecast.patient_id, stock_forecast.name, runs_out_at, patients.name, notified_on "
+            "FROM stock_forecast JOIN patients ON patients.id = stock_forecast.patient_id "
+            "WHERE reorder_at <= ? ORDER BY runs_out_at",
+            (now,))
+
+    def mark_reorder_notified(self, patient_id, name, day):
+        # Предупреждение о покупке показывается раз в день, даже если его
+        # проверяют и окно программы, и служба напоминаний.
+        with self.transaction() as conn:
+            return conn.execute(
+                "UPDATE stock_forecast SET notified_on = ? WHERE patient_id = ? AND name = ? AND (notified_on IS NULL OR notified_on < ?)",
+                (day, patient_id, name, day)).rowcount > 0
+
+    def medicine_history(self):
+        return sorted(self.cache.history_names())
+
+    def inventory_names(self):
+        return list(self.cache.stock_levels())
+
+    def stock_level(self, name):
+        return self.cache.stock_levels().get(name)
+
+    def get_inventory_item(self, inventory_id):
+        return self.query_one(
+            "SELECT id, name, quantity FROM inventory WHERE id = ?",
+            (inventory_id,))
+
+    def add_inventory_item(self, name, quantity):
+        with self.transaction() as conn:
+            inventory_id = conn.execute(
+                "INSERT INTO inventory (name, quantity, patient_id) VALUES (?, ?, ?)",
+                (name, quantity, self.patient_id)).lastrowid
+            self.changed("inventory", inventory_id)
+            self.record_stock(inventory_id, self.patient_id, quantity,
+                              "restock")
+            self.cache.set_stock(self.patient_id, name, quantity)
+            self.forecast_changed(self.patient_id, name)
+        return inventory_id
+
+    def inventory_owner(self, inventory_id):
+        return self.query_one(
+            "SELECT patient_id, name, quantity FROM inventory WHERE id = ?",
+            (inventory_id,))
+
+    def update_inventory_item(self, inventory_id, name, quantity):
+        with self.transaction() as conn:
+            old = self.inventory_owner(inventory_id)
+            conn.execute(
+                "UPDATE inventory SET name = ?, quantity = ? WHERE id = ?",
+                (name, quantity, inventory_id))
+            self.changed("inventory", inventory_id)
+            if old is not None:
+                self.record_stock(inventory_id, old[0], quantity - old[2],
+                                  "correction")
+                self.cache.remove_stock(old[0], old[1])
+                self.cache.set_stock(old[0], name, quantity)
+                self.forecast_changed(old[0], old[1])
+                self.forecast_changed(old[0], name)
+
+    def delete_inventory_item(self, inventory_id):
+        with self.transaction() as conn:
+            old = self.inventory_owner(inventory_id)
+            if old is not None:
+                # Списание остатка сохраняется в журнале и после удаления.
+                self.record_stock(inventory_id, old[0], -old[2], "correction")
+            conn.execute("DELETE FROM inventory WHERE id = ?", (inventory_id,))
+            self.changed("inventory", inventory_id)
+            if old is not None:
+                self.cache.remove_stock(old[0], old[1])
+                self.forecast_changed(old[0], old[1])
+
+    def adjust_stock(self, name, delta, kind, patient_id=None):
+        if patient_id is None:
+            patient_id = self.patient_id
+        with self.transaction() as conn:
+            row = self.query_one(
+                "SELECT id FROM inventory WHERE patient_id = ? AND name = ?",
+                (patient_id, name))
+            if row is None:
+                return
+            conn.execute(
+                "UPDATE inventory SET quantity = quantity + ? WHERE id = ?",
+                (delta, row[0]))
+            self.changed("inventory", row[0])
+            self.record_stock(row[0], patient_id, delta, kind)
+            self.cache.adjust_stock(patient_id, name, delta)
+            self.forecast_changed(patient_id, name)
+
+    def record_stock(self, inventory_id, patient_id, delta, kind):
+        # Вызывается внутри транзакции, изменившей quantity. Счетчик
+        # ledger_pending хранит число записей после последнего снимка.
+        if not delta:
+            return
+        now = int(time.time())
+        ledger_id = self.conn.execute(
+            "INSERT INTO stock_ledger (inventory_id, patient_id, delta, kind, created_at) VALUES (?, ?, ?, ?, ?)",
+            (inventory_id, patient_id, delta, kind, now)).lastrowid
+        self.changed("stock_ledger", ledger_id)
+        self.conn.execute(
+            "UPDATE inventory SET ledger_pending = ledger_pending + 1 WHERE id = ?",
+            (inventory_id,))
+        pending = self.query_one(
+            "SELECT ledger_pending FROM inventory WHERE id = ?",
+            (inventory_id,))
+        if pending is not None and pending[0] >= SNAPSHOT_INTERVAL:
+            # Остаток снимка считается по журналу, а не берется из
+            # inventory, чтобы расхождение не пропадало незамеченным.
+            self.conn.execute(
+                "INSERT INTO stock_snapshots (inventory_id, ledger_id, balance, taken_at) VALUES (?, ?, ?, ?)",
+                (inventory_id, ledger_id, self.stock_balance(inventory_id),
+                 now))
+            self.conn.execute(
+                "UPDATE inventory SET ledger_pending = 0 WHERE id = ?",
+                (inventory_id,))
+
+    def stock_balance(self, inventory_id, at=None):
+        # Последний снимок не позже момента at и не больше
+        # SNAPSHOT_INTERVAL записей журнала после него.
+        at = int(time.time()) if at is None else at
+        snapshot = self.query_one(
+            "SELECT balance, taken_at, ledger_id FROM stock_snapshots "
+            "WHERE inventory_id = ? AND taken_at <= ? "
+            "ORDER BY taken_at DESC, ledger_id DESC LIMIT 1",
+            (inventory_id, at))
+        balance, taken_at, ledger_id = snapshot or (0, 0, 0)
+        return balance + int(self.query_one(
+            "SELECT TOTAL(delta) FROM stock_ledger "
+            "WHERE inventory_id = ? AND (created_at, id) > (?, ?) AND created_at <= ?",
+            (inventory_id, taken_at, ledger_id, at))[0])
+
+    def stock_drift(self):
+        # Лекарства выбранного пациента, у которых остаток в запасах
+        # разошелся с журналом (например, после правки базы вручную).
+        drift = []
+        for inventory_id, name, quantity in self.query_all(
+                "SELECT id, name, quantity FROM inventory WHERE patient_id = ?",
+                (self.patient_id,)):
+            balance = self.stock_balance(inventory_id)
+            if balance != quantity:
+                drift.append((inventory_id, name, quantity, balance))
+        return drift
+
+    def reconcile_stock(self, kind="correction"):
+        with self.transaction():
+            drift = self.stock_drift()
+            for inventory_id, _, quantity, balance in drift:
+                self.record_stock(inventory_id, self.patient_id,
+                                  quantity - balance, kind)
+        return len(drift)
+
+    def get_dose(self, dose_id):
+        return self.query_one(
+            "SELECT id, name, dosage, date, time, patient_id FROM medicines WHERE id = ?",
+            (dose_id,))
+
+    def due_doses(self, now):
+        # Один проход по индексу due_at для всех пациентов сразу.
+        return self.query_all(
+            "SELECT medicines.id, medicines.name, dosage, date, time, patient_id, patients.name, due_at "
+            "FROM medicines JOIN patients ON patients.id = medicines.patient_id "
+            "WHERE due_at <= ? ORDER BY due_at",
+            (now,))
+
+    def next_due_at(self):
+        return self.query_one("SELECT MIN(due_at) FROM medicines")[0]
+
+    def schedule_dose(self, name, dosage, date, time):
+        with self.transaction() as conn:
+            dose_id = conn.execute(
+                "INSERT INTO medicines (name, dosage, date, time, due_at, patient_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, dosage, date, time, due_timestamp(date, time),
+                 self.patient_id)).lastrowid
+            self.changed("medicines", dose_id)
+            self.adjust_stock(name, -dosage, "reserve")
+            self.cache.add_name(self.patient_id, name)
+        return dose_id
+
+    def schedule_course(self, name, dosage, start_date, start_time,
+                        interval_minutes, count=None, end_date=None):
+        # Курс записывается целиком или не записывается совсем: запас
+        # проверяется и списывается один раз, приемы вставляются одним
+        # executemany в одной транзакции.
+        if interval_minutes <= 0:
+            raise ValueError("Интервал курса должен быть больше нуля.")
+        if count is None and end_date is None:
+            raise ValueError("Укажите число приемов или дату окончания курса.")
+        occurrence = datetime.datetime.strptime(
+            f"{start_date} {start_time}", DATETIME_FORMAT)
+        step = datetime.timedelta(minutes=interval_minutes)
+        limit = None
+        if end_date:
+            limit = datetime.datetime.strptime(f"{end_date} 23:59",
+                                               DATETIME_FORMAT)
+        doses = []
+        while ((count is None or len(doses) < count)
+               and (limit is None or occurrence <= limit)):
+            if len(doses) >= MAX_COURSE_DOSES:
+                raise ValueError(
+                    f"Курс не может содержать больше {MAX_COURSE_DOSES} приемов.")
+            doses.append((name, dosage, occurrence.strftime("%Y-%m-%d"),
+                          occurrence.strftime("%H:%M"),
+                          int(occurrence.timestamp()), self.patient_id))
+            occurrence += step
+        if not doses:
+            raise ValueError("Курс не содержит ни одного приема.")
+
+        total = dosage * len(doses)
+        with self.transaction() as conn:
+            # Запас читается уже под блокировкой записи, поэтому другой
+            # процесс не успеет списать его между проверкой и вставкой.
+            stock = self.stock_level(name)
+            if stock is None:
+                raise ValueError(
+                    f"Лекарство '{name}' отсутствует на складе. Добавьте его в запасы.")
+            if total > stock:
+                raise ValueError(
+                    f"Недостаточно лекарства '{name}' на складе. Требуется {total}, а есть {stock}.")
+            conn.executemany(
+                "INSERT INTO medicines (name, dosage, date, time, due_at, patient_id) VALUES (?, ?, ?, ?, ?, ?)",
+                doses)
+            self.changed("medicines")
+            self.adjust_stock(name, -total, "reserve")
+            self.cache.add_name(self.patient_id, name)
+        return len(doses)
+
+    def update_dose(self, dose_id, name, dosage, date, time):
+        with self.transaction() as conn:
+            old = self.get_dose(dose_id)
+            if old is None:
+                return
+            # Списание под прием пересчитывается: прежнее количество
+            # возвращается в запас, новое списывается после той же проверки
+            # остатка, что и при добавлении. При ошибке откатывается все.
+            patient_id = old[5]
+            self.adjust_stock(old[1], int(old[2]), "release", patient_id)
+            stock = self.patient_stock(patient_id, name)
+            if stock is None:
+                raise ValueError(
+                    f"Лекарство '{name}' отсутствует на складе. Добавьте его в запасы.")
+            if dosage > stock:
+                raise ValueError(
+                    f"Недостаточно лекарства '{name}' на складе. Требуется {dosage}, а есть {stock}.")
+            self.adjust_stock(name, -dosage, "reserve", patient_id)
+            self.forecast_changed(patient_id, old[1])
+            self.forecast_changed(patient_id, name)
+            self.changed("medicines", dose_id)
+            conn.execute(
+                "UPDATE medicines SET name = ?, dosage = ?, date = ?, time = ?, due_at = ? WHERE id = ?",
+                (name, dosage, date, time, due_timestamp(date, time), dose_id))
+            self.cache.add_name(patient_id, name)
+
+    def cancel_dose(self, dose_id):
+        with self.transaction() as conn:
+            dose = self.get_dose(dose_id)
+            if dose is None:
+                return None
+            self.adjust_stock(dose[1], int(dose[2]), "release", dose[5])
+            conn.execute("DELETE FROM medicines WHERE id = ?", (dose_id,))
+            self.changed("medicines", dose_id)
+        return dose
+
+    def claim_due_doses(self, now, received_time):
+        # Все наступившие приемы переносятся в журнал одной транзакцией:
+        # после простоя это один commit, а не commit на каждый прием.
+        # Под блокировкой BEGIN IMMEDIATE другой процесс (служба напоминаний
+        # или второе окно) не может забрать те же приемы.
+        with self.transaction() as conn:
+            doses = self.due_doses(now)
+            if not doses:
+                return doses
+            last_log_id = self.last_log_id()
+            conn.execute(
+                "INSERT INTO medicines_log (name, dosage, date, time, received_time, patient_id, delay_seconds) "
+                "SELECT name, dosage, date, time, ?, patient_id, MAX(? - due_at, 0) FROM medicines "
+                "WHERE due_at <= ? ORDER BY due_at",
+                (received_time, now, now))
+            adherence.record(conn, "id > :last", {"last": last_log_id})
+            conn.execute("DELETE FROM medicines WHERE due_at <= ?", (now,))
+            for dose in doses:
+                self.forecast_changed(dose[5], dose[1])
+            self.changed("medicines", *(dose[0] for dose in doses))
+            self.changed("medicines_log")
+        return doses
+
+    def add_rule(self, name, dosage, start_date, start_time,
+                 interval_minutes, end_date=None):
+        with self.transaction() as conn:
+            rule_id = conn.execute(
+                "INSERT INTO medicine_rules (name, dosage, start_date, start_time, interval_minutes, end_date, patient_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, dosage, start_date, start_time, interval_minutes,
+                 end_date, self.patient_id)).lastrowid
+            # Как и для курса, запас должен покрывать приемы, которые
+            # правило сразу запишет в расписание.
+            now = datetime.datetime.now().replace(second=0, microsecond=0)
+            doses = self.rule_doses(
+                (rule_id, name, dosage, start_date, start_time,
+                 interval_minutes, end_date, None, self.patient_id),
+                now, now + datetime.timedelta(days=EXPANSION_DAYS))
+            stock = self.patient_stock(self.patient_id, name)
+            if stock is None:
+                raise ValueError(
+                    f"Лекарство '{name}' отсутствует на складе. Добавьте его в запасы.")
+            if dosage * len(doses) > stock:
+                raise ValueError(
+                    f"Недостаточно лекарства '{name}' на складе. Требуется {dosage * len(doses)} на ближайшие {EXPANSION_DAYS} дней, а есть {stock}.")
+            self.cache.add_name(self.patient_id, name)
+            self.forecast_changed(self.patient_id, name)
+            self.expand_rules(now)
+        return rule_id
+
+    def patient_stock(self, patient_id, name):
+        row = self.query_one(
+            "SELECT quantity FROM inventory WHERE patient_id = ? AND name = ?",
+            (patient_id, name))
+        return row[0] if row else None
+
+    def rule_doses(self, rule, now, horizon):
+        (rule_id, name, dosage, start_date, start_time, interval,
+         end_date, expanded_until, patient_id) = rule
+        step = datetime.timedelta(minutes=interval)
+        if expanded_until:
+            occurrence = datetime.datetime.strptime(
+                expanded_until, DATETIME_FORMAT) + step
+        else:
+            occurrence = datetime.datetime.strptime(
+                f"{start_date} {start_time}", DATETIME_FORMAT)
+        if occurrence < now:
+            # Пропущенные за время простоя повторы не восстанавливаются.
+            missed = -(-(now - occurrence) // step)
+            occurrence += step * missed
+        limit = horizon
+        if end_date:
+            limit = min(limit, datetime.datetime.strptime(
+                f"{end_date} 23:59", DATETIME_FORMAT))
+
+        doses = []
+        while occurrence <= limit:
+            doses.append((name, dosage, occurrence.strftime("%Y-%m-%d"),
+                          occurrence.strftime("%H:%M"),
+                          int(occurrence.timestamp()), rule_id, patient_id))
+            occurrence += step
+        return doses
+
+    def expand_rules(self, now=None):
+        # Правило разворачивается в конкретные приемы только на ближайшие
+        # EXPANSION_DAYS дней, остальные появятся при следующих вызовах.
+        now = now or datetime.datetime.now().replace(second=0, microsecond=0)
+        horizon = now + datetime.timedelta(days=EXPANSION_DAYS)
+        params = {"horizon": horizon.strftime(DATETIME_FORMAT),
+                  "horizon_seconds": horizon.strftime("%Y-%m-%d %H:%M:%S")}
+        # Без блокировки записи проверяется, есть ли правило, которое
+        # действительно добавит приемы: не завершенное, со следующим
+        # повтором до горизонта и с запасом хотя бы на один прием.
+        # Иначе каждый вызов брал бы BEGIN IMMEDIATE впустую.
+        if self.query_one(f'''
+                SELECT 1 FROM medicine_rules {RULES_PENDING}
+                AND CASE WHEN expanded_until IS NULL
+                         THEN start_date || ' ' || start_time <= :horizon
+                         ELSE datetime(expanded_until, '+' || interval_minutes
+                                       || ' minutes') <= :horizon_seconds
+                    END
+                AND EXISTS (
+                    SELECT 1 FROM inventory
+                    WHERE inventory.patient_id = medicine_rules.patient_id
+                        AND inventory.name = medicine_rules.name
+                        AND inventory.quantity >= medicine_rules.dosage)
+                LIMIT 1''', params) is None:
+            return 0
+        created = 0
+        # Правила читаются уже под BEGIN IMMEDIATE: окно и служба
+        # напоминаний, проснувшиеся одновременно, иначе развернули бы
+        # одни и те же повторы дважды.
+        with self.transaction() as conn:
+            rules = self.query_all(
+                "SELECT id, name, dosage, start_date, start_time, interval_minutes, end_date, expanded_until, patient_id FROM medicine_rules "
+                + RULES_PENDING, params)
+            for rule in rules:
+                rule_id, name, dosage, end_date, patient_id = (
+                    rule[0], rule[1], rule[2], rule[6], rule[8])
+                all_doses = self.rule_doses(rule, now, horizon)
+                # В расписание попадает столько повторов, на сколько хватает
+                # запаса. Остальные появятся после пополнения, а прогноз
+                # запаса тем временем напоминает о покупке.
+                stock = self.patient_stock(patient_id, name) or 0
+                doses = all_doses
+                if dosage > 0:
+                    doses = doses[:max(stock // dosage, 0)]
+                expanded_until = None
+                if doses:
+                    expanded_until = f"{doses[-1][2]} {doses[-1][3]}"
+                end = end_date and f"{end_date} 23:59"
+                if end and end <= params["horizon"] and \
+                        len(doses) == len(all_doses):
+                    # Все повторы до конца правила записаны: правило
+                    # завершено и больше не проверяется.
+                    expanded_until = end
+                if expanded_until is None:
+                    continue
+                if doses:
+                    conn.executemany(
+                        "INSERT INTO medicines (name, dosage, date, time, due_at, rule_id, patient_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        doses)
+                    self.changed("medicines")
+                    self.adjust_stock(name, -dosage * len(doses), "reserve",
+                                      patient_id)
+                conn.execute(
+                    "UPDATE medicine_rules SET expanded_until = ? WHERE id = ?",
+                    (expanded_until, rule_id))
+                created += len(doses)
+        return created
+
+    def dose_rule(self, dose_id):
+        row = self.query_one(
+            "SELECT rule_id FROM medicines WHERE id = ?", (dose_id,))
+        return row[0] if row else None
+
+    def cancel_rule(self, rule_id):
+        with self.transaction() as conn:
+            rule = self.query_one(
+                "SELECT patient_id, name FROM medicine_rules WHERE id = ?",
+                (rule_id,))
+            if rule is not None:
+                self.forecast_changed(*rule)
+            for name, dosage, patient_id in self.query_all(
+                    "SELECT name, SUM(dosage), patient_id FROM medicines WHERE rule_id = ? GROUP BY patient_id, name",
+                    (rule_id,)):
+                self.adjust_stock(name, int(dosage), "release", patient_id)
+            conn.execute("DELETE FROM medicines WHERE rule_id = ?", (rule_id,))
+            self.changed("medicines")
+            conn.execute("DELETE FROM medicine_rules WHERE id = ?", (rule_id,))
+
+    def add_log_entry(self, name, dosage, date, time, received_time=None,
+                      description=None):
+        with self.transaction() as conn:
+            log_id = conn.execute(
+                "INSERT INTO medicines_log (name, dosage, date, time, received_time, description, patient_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, dosage, date, time, received_time, description,
+                 self.patient_id)).lastrowid
+            adherence.record(conn, "id = :id", {"id": log_id})
+            self.changed("medicines_log", log_id)
+            self.cache.add_name(self.patient_id, name)
+        return log_id
+
+    def last_log_id(self):
+        return self.query_one(
+            "SELECT IFNULL(MAX(id), 0) FROM medicines_log")[0]
+
+    def delete_log_entry(self, log_id):
+        with self.transaction() as conn:
+            adherence.record(conn, "id = :id", {"id": log_id}, sign=-1)
+            self.changed("medicines_log", log_id)
+            return conn.execute("DELETE FROM medicines_log WHERE id = ?",
+                                (log_id,)).rowcount
+
+    def set_log_description(self, log_id, description):
+        with self.transaction() as conn:
+            self.changed("medicines_log", log_id)
+            return conn.execute(
+                "UPDATE medicines_log SET description = ? WHERE id = ?",
+                (description, log_id)).rowcount
+
+    def adherence_report(self, start, end):
+        return adherence.report(self.conn, self.patient_id, start, end)
+
+    def rebuild_adherence(self):
+        # Сводки пересчитываются по журналу в базе; записи, уже
+        # перенесенные в архив, при этом из них пропадают.
+        with self.transaction() as conn:
+            for table in adherence.PERIODS:
+                conn.execute(f"DELETE FROM {table} WHERE patient_id = ?",
+                             (self.patient_id,))
+            adherence.record(conn, "patient_id = :patient_id",
+                             {"patient_id": self.patient_id})
+            self.changed("adherence_daily")
+
+    def reset(self):
+        # Сбрасываются только данные выбранного пациента.
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM stock_snapshots WHERE inventory_id IN (SELECT inventory_id FROM stock_ledger WHERE patient_id = ?)",
+                (self.patient_id,))
+            for table in ("medicines", "medicine_rules", "inventory",
+                          "medicines_log", "stock_forecast", "stock_ledger",
+                          "adherence_daily", "adherence_monthly"):
+                conn.execute(f"DELETE FROM {table} WHERE patient_id = ?",
+                             (self.patient_id,))
+                self.changed(table)
+            self.cache.invalidate()
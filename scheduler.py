@@ -0,0 +1,76 @@
+import datetime
+import time
+
+from adherence import LATE_AFTER
+from repository import DATETIME_FORMAT
+
+# Интервал ожидания ограничен сверху, чтобы переводы системных часов и сон
+# компьютера не откладывали уведомление надолго.
+MAX_INTERVAL = 60 * 60
+SUMMARY_LINES = 5
+
+
+def deliver_due(repo, notifier, now=None):
+    # Выборка по индексу due_at: просроченный вчерашний прием тоже
+    # попадает в диапазон, строки не разбираются в Python.
+    now = int(time.time()) if now is None else now
+    received_time = datetime.datetime.fromtimestamp(now).strftime(
+        DATETIME_FORMAT)
+    doses = repo.claim_due_doses(now, received_time)
+    if doses:
+        # Имя пациента добавляется в уведомление, только если их несколько.
+        several_patients = len(repo.patients()) > 1
+        notifier.notify(*summary(doses, now, several_patients))
+    repo.expand_rules()
+    warn_reorder(repo, notifier, now)
+    return len(doses)
+
+
+def summary(doses, now, several_patients):
+    # Один прием — обычное напоминание. После простоя (закрытая программа,
+    # сон компьютера) все пропущенные приемы сводятся в одно уведомление.
+    def describe(dose):
+        text = f"{dose[1]} ({dose[2]})"
+        if several_patients:
+            text = f"{dose[6]}: {text}"
+        return text
+
+    if len(doses) == 1:
+        return "Время приема лекарства", describe(doses[0])
+    late = any(now - dose[7] >= LATE_AFTER for dose in doses)
+    title = ("Пропущенные приемы лекарств" if late
+             else "Время приема лекарств")
+    lines = [f"{dose[3]} {dose[4]} {describe(dose)}" if late
+             else describe(dose) for dose in doses[:SUMMARY_LINES]]
+    if len(doses) > SUMMARY_LINES:
+        lines.append(f"и еще {len(doses) - SUMMARY_LINES}")
+    return title, "\n".join(lines)
+
+
+def warn_reorder(repo, notifier, now=None):
+    # Прогноз уже посчитан при изменении запасов и расписания, здесь только
+    # выборка по индексу reorder_at.
+    now = int(time.time()) if now is None else now
+    today = datetime.date.fromtimestamp(now).isoformat()
+    warned = 0
+    rows = [row for row in repo.reorder_due(now)
+            if row[4] is None or row[4] < today]
+    several_patients = rows and len(repo.patients()) > 1
+    for patient_id, name, runs_out_at, patient_name, _ in rows:
+        if not repo.mark_reorder_notified(patient_id, name, today):
+            continue
+        runs_out = datetime.date.fromtimestamp(runs_out_at)
+        message = (f"Лекарство '{name}' закончится {runs_out:%d.%m.%Y}, "
+                   f"пора пополнить запас.")
+        if several_patients:
+            message = f"{patient_name}: {message}"
+        notifier.notify("Запас лекарства", message)
+        warned += 1
+    return warned
+
+
+def seconds_until_next(repo, limit=MAX_INTERVAL):
+    due_at = repo.next_due_at()
+    if due_at is None:
+        return limit
+    return min(max(due_at - time.time(), 0), limit)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["MEDICINES_NOTIFY"] = ""
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / "medicines.db")
+
+
+@pytest.fixture
+def repo(database):
+    from repository import MedicineRepository
+
+    repo = MedicineRepository(database)
+    yield repo
+    repo.close()
+
+
+@pytest.fixture
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+class FakeMainWindow:
+    def __init__(self, repo):
+        from Yandex import ChangeBus
+
+        self.repo = repo
+        self.change_bus = ChangeBus(repo)
+
+    def schedule_changed(self):
+        pass
+
+
+@pytest.fixture
+def main_window(qapp, repo):
+    window = FakeMainWindow(repo)
+    yield window
+    window.change_bus.timer.stop()
@@ -0,0 +1,27 @@
+import adherence
+
+
+def test_report_counts_log_entries_and_their_delay(repo):
+    repo.add_log_entry("Аспирин", 1, "2030-01-01", "08:00", "2030-01-01 08:00")
+    repo.add_log_entry("Аспирин", 1, "2030-01-02", "08:00", "2030-01-02 08:07")
+    repo.add_log_entry("Аспирин", 1, "2030-01-03", "08:00", "2030-01-03 10:30")
+    repo.add_log_entry("Аспирин", 1, "2030-01-04", "08:00")
+
+    rows = repo.adherence_report("2030-01-01", "2030-01-31")
+    assert rows[0] == adherence.AdherenceRow(
+        "Аспирин", logged=4, received=3, on_time=2,
+        median_minutes=5, p95_minutes=120)
+    assert rows[-1].name is None
+
+
+def test_deleted_entries_leave_the_report(repo):
+    log_id = repo.add_log_entry("Аспирин", 1, "2030-01-01", "08:00",
+                                "2030-01-01 08:00")
+    repo.delete_log_entry(log_id)
+    assert repo.adherence_report("2030-01-01", "2030-01-31") == []
+
+
+def test_percentile_is_the_lower_bound_of_its_bucket():
+    histogram = [0] * len(adherence.BUCKETS)
+    histogram[adherence.BUCKETS.index(30)] = 1
+    assert adherence.percentile(histogram, 0.5) == 30
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+import api_server
+
+
+@pytest.fixture
+def api(database, repo):
+    server = api_server.ApiServer(database, readers=1)
+    yield server
+    server.close()
+
+
+def request(api, lines):
+    async def exchange():
+        server = await asyncio.start_server(api.serve_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+            return data
+
+    head, _, body = asyncio.run(exchange()).partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, json.loads(body) if body else None
+
+
+def get(api, target):
+    return request(api, [f"GET {target} HTTP/1.1", "Connection: close"])
+
+
+@pytest.mark.parametrize("target", [
+    "/inventory/99999999999999999999999",
+    "/inventory/" + "9" * 5000,
+    "/inventory/²",
+], ids=["huge", "too-many-digits", "superscript"])
+def test_out_of_range_id_is_not_found(api, target):
+    assert get(api, target)[0] == 404
+
+
+@pytest.mark.parametrize("target", [
+    "/inventory?patient=99999999999999999999999",
+    "/inventory?limit=" + "9" * 5000,
+    "/inventory?after=" + api_server.encode_cursor(["a", 10 ** 30]),
+], ids=["patient", "limit", "after"])
+def test_out_of_range_parameter_is_rejected(api, target):
+    assert get(api, target)[0] == 400
+
+
+def test_bad_content_length_is_rejected(api):
+    status, _ = request(api, ["POST /inventory HTTP/1.1",
+                              "Content-Length: -1", "Connection: close"])
+    assert status == 400
+
+
+def test_oversized_quantity_is_rejected(api):
+    body = json.dumps({"name": "Аспирин", "quantity": 10 ** 30})
+    status, payload = request(api, [
+        "POST /inventory HTTP/1.1", f"Content-Length: {len(body.encode())}",
+        "Connection: close", "", body])
+    assert status == 400
+    assert "quantity" in payload["error"]
+
+
+def test_unexpected_error_returns_500(api, monkeypatch):
+    def broken(conn, *args):
+        raise RuntimeError("сбой")
+
+    monkeypatch.setattr(api_server, "get_row", broken)
+    status, payload = get(api, "/inventory/1")
+    assert status == 500
+    assert payload == {"error": "внутренняя ошибка сервера"}
+
+
+def test_keyset_paging_returns_every_row_once(api, repo):
+    for number in range(25):
+        repo.add_inventory_item(f"Лекарство {number:02}", number)
+    names = []
+    target = "/inventory?limit=10"
+    while target is not None:
+        status, page = get(api, target)
+        assert status == 200
+        names.extend(item["name"] for item in page["items"])
+        target = page["next"] and f"/inventory?limit=10&after={page['next']}"
+    assert names == [f"Лекарство {number:02}" for number in range(25)]
+
+
+def send(api, method, target, record=None):
+    body = "" if record is None else json.dumps(record)
+    return request(api, [f"{method} {target} HTTP/1.1",
+                         f"Content-Length: {len(body.encode())}",
+                         "Connection: close", "", body])
+
+
+def dose(dosage, date="2099-01-01"):
+    return {"name": "Аспирин", "dosage": dosage, "date": date, "time": "08:00"}
+
+
+def test_dose_edit_and_cancel_keep_stock(api, repo):
+    inventory_id = send(api, "POST", "/inventory",
+                        {"name": "Аспирин", "quantity": 10})[1]["id"]
+    dose_id = send(api, "POST", "/medicines", dose(1))[1]["id"]
+    assert send(api, "PUT", f"/medicines/{dose_id}", dose(9))[0] == 200
+    assert get(api, f"/inventory/{inventory_id}")[1]["quantity"] == 1
+
+    status, payload = send(api, "PUT", f"/medicines/{dose_id}", dose(11))
+    assert status == 409
+    assert get(api, f"/medicines/{dose_id}")[1]["dosage"] == 9
+    assert get(api, f"/inventory/{inventory_id}")[1]["quantity"] == 1
+
+    assert send(api, "DELETE", f"/medicines/{dose_id}")[0] == 204
+    assert get(api, f"/inventory/{inventory_id}")[1]["quantity"] == 10
+    assert repo.query_all(
+        "SELECT delta, kind FROM stock_ledger ORDER BY id") == [
+        (10, "restock"), (-1, "reserve"), (1, "release"), (-9, "reserve"),
+        (9, "release")]
+
+
+def test_dose_in_the_past_is_rejected(api):
+    send(api, "POST", "/inventory", {"name": "Аспирин", "quantity": 10})
+    assert send(api, "POST", "/medicines", dose(1, "2001-01-01"))[0] == 400
+    dose_id = send(api, "POST", "/medicines", dose(1))[1]["id"]
+    assert send(api, "PUT", f"/medicines/{dose_id}",
+                dose(1, "2001-01-01"))[0] == 400
+
+
+def test_oversized_header_is_answered(api):
+    status, payload = request(api, ["GET /inventory HTTP/1.1",
+                                    "X-Padding: " + "a" * 70_000,
+                                    "Connection: close"])
+    assert status == 431
+    assert "error" in payload
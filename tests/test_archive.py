@@ -0,0 +1,114 @@
+import datetime
+import sqlite3
+
+import archive
+
+TODAY = datetime.date(2030, 6, 1)
+
+
+def add_log(repo, dates):
+    with repo.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO medicines_log (name, dosage, date, time) "
+            "VALUES ('Аспирин', 1, ?, '08:00')",
+            [(date,) for date in dates])
+
+
+def archived(directory, year):
+    conn = sqlite3.connect(archive.archive_path(year, directory))
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT date FROM medicines_log ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_rollover_moves_old_entries_in_batches(repo, tmp_path):
+    old = [f"2028-{month:02}-01" for month in range(1, 13)]
+    recent = ["2030-01-01", "2030-05-31"]
+    # Новые записи перемежаются со старыми внутри диапазонов id порций.
+    add_log(repo, old[:6] + recent[:1] + old[6:] + recent[1:])
+    directory = str(tmp_path / "archive")
+
+    moved = archive.rollover(repo, TODAY, directory=directory, batch_size=5)
+
+    assert moved == len(old)
+    assert archived(directory, 2028) == old
+    assert [row[0] for row in repo.query_all(
+        "SELECT date FROM medicines_log ORDER BY id")] == recent
+
+
+def test_archive_worker_runs_off_the_gui_thread(main_window, monkeypatch):
+    import Yandex
+
+    calls = []
+    monkeypatch.setattr(archive, "rollover",
+                        lambda repo: calls.append(repo.conn))
+    worker = Yandex.ArchiveWorker(main_window.repo.database)
+    worker.start()
+    worker.thread.join(5)
+    assert len(calls) == 1
+    assert calls[0] is not main_window.repo.conn
+
+
+def test_archive_worker_reports_errors(main_window, monkeypatch):
+    import Yandex
+
+    def locked(repo):
+        raise sqlite3.OperationalError("database is locked")
+
+    errors = []
+    monkeypatch.setattr(archive, "rollover", locked)
+    worker = Yandex.ArchiveWorker(main_window.repo.database)
+    worker.failed.connect(errors.append)
+    worker.run()
+    assert errors == ["database is locked"]
+
+
+def test_new_database_uses_incremental_vacuum(repo):
+    assert repo.query_one("PRAGMA auto_vacuum")[0] == 2
+
+
+def test_rollover_does_not_vacuum_the_whole_database(tmp_path):
+    from repository import MedicineRepository
+
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE medicines_log (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, dosage INTEGER, date TEXT, time TEXT, received_time TEXT, description TEXT)")
+    conn.close()
+    repo = MedicineRepository(path)
+    try:
+        assert repo.query_one("PRAGMA auto_vacuum")[0] == 0
+        add_log(repo, ["2028-01-01"])
+        statements = []
+        repo.conn.set_trace_callback(statements.append)
+        assert archive.rollover(repo, TODAY,
+                                directory=str(tmp_path / "archive")) == 1
+        assert not any(statement.upper().startswith("VACUUM")
+                       or "incremental_vacuum" in statement
+                       for statement in statements)
+    finally:
+        repo.close()
+
+
+def test_log_window_detaches_archives(main_window, tmp_path, monkeypatch):
+    import windows
+
+    monkeypatch.chdir(tmp_path)
+    repo = main_window.repo
+    add_log(repo, ["2028-01-01", "2030-05-01"])
+    archive.rollover(repo, TODAY)
+
+    def attached():
+        return [row[1] for row in repo.conn.execute("PRAGMA database_list")
+                if row[1].startswith("archive_")]
+
+    window = windows.LogWindow(main_window)
+    window.archive_checkbox.setChecked(True)
+    assert attached() == ["archive_2028"]
+    window.archive_checkbox.setChecked(False)
+    assert attached() == []
+
+    window.archive_checkbox.setChecked(True)
+    window.close()
+    assert attached() == []
@@ -0,0 +1,30 @@
+import bulk_io
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_import_books_only_imported_medicines(repo, tmp_path):
+    repo.add_inventory_item("Аспирин", 10)
+    unrelated = repo.add_inventory_item("Ибупрофен", 4)
+    # Расхождение, внесенное в обход репозитория, импорт не исправляет.
+    repo.conn.execute("UPDATE inventory SET quantity = 7 WHERE id = ?",
+                      (unrelated,))
+
+    report = bulk_io.import_file(repo, "inventory", write(
+        tmp_path / "inventory.csv",
+        "name,quantity\nАспирин,5\nПарацетамол,3\nПарацетамол,1\n"))
+    assert report.imported == 3
+    report = bulk_io.import_file(repo, "schedule", write(
+        tmp_path / "schedule.csv",
+        "name,dosage,date,time\nАспирин,2,2099-01-01,08:00\n"))
+    assert report.imported == 1
+
+    assert repo.query_all(
+        "SELECT inventory.name, delta FROM stock_ledger "
+        "JOIN inventory ON inventory.id = stock_ledger.inventory_id "
+        "WHERE kind = 'import' ORDER BY stock_ledger.id") == [
+        ("Аспирин", 5), ("Парацетамол", 4), ("Аспирин", -2)]
+    assert repo.stock_drift() == [(unrelated, "Ибупрофен", 7, 4)]
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE medicines (id INTEGER PRIMARY KEY, name TEXT, date TEXT);
+        CREATE INDEX medicines_name ON medicines (name);
+    """)
+    yield conn
+    conn.close()
+
+
+def full_scan(conn, sql):
+    stats = instrumentation.StatementStats(sql)
+    instrumentation.explain(conn, stats, sql, ())
+    return stats.full_scan
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM medicines",
+    "SELECT * FROM medicines m WHERE m.date > '2030'",
+    "SELECT * FROM main.medicines AS m ORDER BY date",
+])
+def test_table_scan_is_flagged(conn, sql):
+    assert full_scan(conn, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM medicines WHERE name = 'Аспирин'",
+    "SELECT * FROM (SELECT name, COUNT(*) FROM medicines "
+    "WHERE name > 'А' GROUP BY name)",
+    "WITH names AS MATERIALIZED (SELECT name FROM medicines WHERE name > 'А') "
+    "SELECT * FROM names, names AS other",
+    "WITH RECURSIVE days(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM days "
+    "WHERE n < 7) SELECT * FROM days",
+    "SELECT 1",
+])
+def test_scan_of_subquery_or_cte_is_not_flagged(conn, sql):
+    assert not full_scan(conn, sql)
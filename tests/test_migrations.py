@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import adherence
+import forecast
+import migrations
+
+
+def migrate_to(conn, version):
+    cursor = conn.cursor()
+    for migration in migrations.MIGRATIONS[:version]:
+        migration(cursor)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+
+
+@pytest.fixture
+def old_database(database):
+    # База версии 6: пациенты уже есть, прогноза и журнала запасов еще нет.
+    conn = sqlite3.connect(database)
+    migrate_to(conn, 6)
+    conn.executemany(
+        "INSERT INTO inventory (name, quantity) VALUES (?, ?)",
+        [("Аспирин", 0), ("Парацетамол", 10), ("Ибупрофен", 5)])
+    conn.executemany(
+        "INSERT INTO medicines (name, dosage, date, time, due_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [("Аспирин", 1, "2030-01-01", "08:00", 1893484800),
+         ("Аспирин", 1, "2030-01-02", "08:00", 1893571200)])
+    conn.execute(
+        "INSERT INTO medicine_rules (name, dosage, start_date, start_time, "
+        "interval_minutes, expanded_until) "
+        "VALUES ('Парацетамол', 1, '2030-01-01', '08:00', 60, '2030-01-08 08:00')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_forecast_migration_matches_refresh(old_database):
+    conn = old_database
+    migrations.migrate(conn)
+    migrated = conn.execute(
+        "SELECT * FROM stock_forecast ORDER BY name").fetchall()
+    conn.execute("DELETE FROM stock_forecast")
+    forecast.refresh(conn)
+    assert migrated == conn.execute(
+        "SELECT * FROM stock_forecast ORDER BY name").fetchall()
+    assert len(migrated) == 3
+
+
+def test_adherence_migration_matches_record(old_database):
+    conn = old_database
+    conn.executemany(
+        "INSERT INTO medicines_log (name, dosage, date, time, received_time) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [("Аспирин", 1, "2029-12-30", "08:00", "2029-12-30 08:00"),
+         ("Аспирин", 1, "2029-12-31", "08:00", "2029-12-31 08:40"),
+         ("Аспирин", 1, "2030-01-01", "08:00", None),
+         ("Парацетамол", 1, "2030-01-01", "09:00", "2030-01-02 12:00")])
+    conn.commit()
+    migrations.migrate(conn)
+    tables = ("adherence_daily", "adherence_monthly")
+    migrated = [conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall()
+                for table in tables]
+    for table in tables:
+        conn.execute(f"DELETE FROM {table}")
+    adherence.record(conn)
+    assert migrated == [
+        conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall()
+        for table in tables]
+    assert len(migrated[0]) == 4
+
+
+def test_rule_queries_use_indexes(repo):
+    import repository
+
+    queries = [
+        (forecast.REFRESH.format(condition=forecast.CONDITIONS[True, True]),
+         {"patient_id": 1, "name": "Аспирин", "now": 0, "lead": 0}),
+        (forecast.REFRESH.format(condition=forecast.CONDITIONS[True, False]),
+         {"patient_id": 1, "now": 0, "lead": 0}),
+        ("SELECT 1 FROM medicine_rules " + repository.RULES_PENDING,
+         {"horizon": "2030-01-01 08:00"}),
+    ]
+    for sql, params in queries:
+        plan = [row[3] for row in repo.conn.execute(
+            "EXPLAIN QUERY PLAN " + sql, params)]
+        assert not any(detail.startswith("SCAN medicine_rules")
+                       for detail in plan), plan
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from notifier import NotificationDispatcher
+
+
+class RecordingBackend:
+    name = "record"
+    send_timeout = 1
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.sent = []
+        self.received = threading.Event()
+
+    def send(self, title, message):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("нет связи")
+        self.sent.append((title, message))
+        self.received.set()
+
+
+class HangingBackend:
+    name = "hang"
+    send_timeout = 0.2
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def send(self, title, message):
+        self.calls += 1
+        self.release.wait()
+
+
+def test_hung_backend_does_not_delay_others():
+    hanging = HangingBackend()
+    fast = RecordingBackend()
+    dispatcher = NotificationDispatcher([hanging, fast], retries=2,
+                                        retry_delay=0.05)
+    started = time.monotonic()
+    dispatcher.notify("Напоминание", "Аспирин")
+    assert fast.received.wait(1)
+    assert time.monotonic() - started < hanging.send_timeout
+    assert fast.sent == [("Напоминание", "Аспирин")]
+
+    # Повторы не запускают новые вызовы, пока зависший не завершился.
+    time.sleep(1)
+    assert hanging.calls == 1
+    hanging.release.set()
+    dispatcher.stop(timeout=2)
+
+
+def test_failed_send_is_retried():
+    backend = RecordingBackend(failures=2)
+    dispatcher = NotificationDispatcher([backend], retries=2, retry_delay=0.01)
+    dispatcher.notify("Напоминание", "Аспирин")
+    dispatcher.stop(timeout=2)
+    assert backend.calls == 3
+    assert backend.sent == [("Напоминание", "Аспирин")]
+
+
+def test_stop_does_not_wait_for_hung_backend():
+    hanging = HangingBackend()
+    dispatcher = NotificationDispatcher([hanging], retries=0)
+    dispatcher.notify("Напоминание", "Аспирин")
+    started = time.monotonic()
+    dispatcher.stop(timeout=0.5)
+    assert time.monotonic() - started < 1
+    assert all(worker.thread.daemon for worker in dispatcher.workers)
+    hanging.release.set()
@@ -0,0 +1,38 @@
+import sqlite3
+
+import scheduler
+
+
+def test_notification_timer_rearms_after_database_error(qapp, repo, monkeypatch):
+    from Yandex import NotificationTimer
+
+    def locked(repo, notifier):
+        raise sqlite3.OperationalError("database is locked")
+
+    timer = NotificationTimer(repo, None)
+    timer.timer.stop()
+    monkeypatch.setattr(scheduler, "deliver_due", locked)
+    timer.check_notifications()
+    assert timer.timer.isActive()
+    assert timer.timer.remainingTime() > (timer.RETRY_INTERVAL - 1) * 1000
+    timer.timer.stop()
+
+
+def test_daemon_keeps_running_after_database_error(repo, monkeypatch):
+    import asyncio
+
+    import reminder_daemon
+
+    stop = asyncio.Event()
+    calls = []
+
+    def deliver_due(repo, notifier):
+        calls.append(None)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        stop.set()
+
+    monkeypatch.setattr(scheduler, "deliver_due", deliver_due)
+    monkeypatch.setattr(reminder_daemon, "POLL_INTERVAL", 0.01)
+    asyncio.run(reminder_daemon.run(repo, None, stop))
+    assert len(calls) == 2
@@ -0,0 +1,71 @@
+def test_update_dose_adds_name_to_owning_patient(repo):
+    other = repo.add_patient("Пациент 2")
+    repo.set_patient(other)
+    repo.add_inventory_item("Парацетамол", 1)
+    dose_id = repo.schedule_dose("Аспирин", 1, "2030-01-01", "08:00")
+    repo.set_patient(1)
+    assert repo.medicine_history() == []
+
+    repo.update_dose(dose_id, "Парацетамол", 1, "2030-01-01", "09:00")
+    assert repo.medicine_history() == []
+    repo.set_patient(other)
+    assert repo.medicine_history() == ["Парацетамол"]
+
+
+def test_stock_ledger_matches_inventory(repo, monkeypatch):
+    import repository
+
+    monkeypatch.setattr(repository, "SNAPSHOT_INTERVAL", 3)
+    inventory_id = repo.add_inventory_item("Аспирин", 10)
+    for delta in (-1, -2, 5, -3, -1):
+        repo.adjust_stock("Аспирин", delta, "reserve")
+
+    assert repo.stock_level("Аспирин") == 8
+    assert repo.stock_balance(inventory_id) == 8
+    assert repo.query_one(
+        "SELECT COUNT(*) FROM stock_snapshots WHERE inventory_id = ?",
+        (inventory_id,))[0] == 2
+    assert repo.stock_drift() == []
+
+
+def test_reconcile_records_manual_changes(repo):
+    inventory_id = repo.add_inventory_item("Аспирин", 10)
+    repo.conn.execute("UPDATE inventory SET quantity = 7 WHERE id = ?",
+                      (inventory_id,))
+    assert repo.stock_drift() == [(inventory_id, "Аспирин", 7, 10)]
+
+    assert repo.reconcile_stock() == 1
+    assert repo.stock_drift() == []
+    assert repo.query_all(
+        "SELECT delta, kind FROM stock_ledger WHERE inventory_id = ? ORDER BY id",
+        (inventory_id,)) == [(10, "restock"), (-3, "correction")]
+
+
+def test_concurrent_claims_log_each_dose_once(repo, database):
+    import threading
+
+    from repository import MedicineRepository
+
+    repo.add_inventory_item("Аспирин", 100)
+    for hour in range(50):
+        repo.schedule_dose("Аспирин", 1, "2000-01-01", f"{hour % 24:02}:00")
+    other = MedicineRepository(database, check_same_thread=False)
+    barrier = threading.Barrier(2)
+    claimed = {}
+
+    def claim(name, claimer):
+        barrier.wait()
+        claimed[name] = claimer.claim_due_doses(2 ** 40, "2030-01-01 08:00")
+
+    threads = [threading.Thread(target=claim, args=("other", other))]
+    threads[0].start()
+    claim("repo", repo)
+    threads[0].join()
+    other.close()
+
+    ids = [dose[0] for doses in claimed.values() for dose in doses]
+    assert len(ids) == len(set(ids)) == 50
+    assert repo.query_one("SELECT COUNT(*) FROM medicines")[0] == 0
+    assert repo.query_one("SELECT COUNT(*) FROM medicines_log")[0] == 50
+    assert repo.query_one(
+        "SELECT SUM(scheduled) FROM adherence_daily")[0] == 50
@@ -0,0 +1,123 @@
+import datetime
+import threading
+
+from repository import MedicineRepository
+
+NOW = datetime.datetime(2030, 1, 1, 8, 0)
+
+
+def add_hourly_rule(repo, name="Аспирин", stock=1000):
+    repo.add_inventory_item(name, stock)
+    with repo.transaction() as conn:
+        conn.execute(
+            "INSERT INTO medicine_rules (name, dosage, start_date, start_time, interval_minutes, patient_id) VALUES (?, 1, '2030-01-01', '08:00', 60, ?)",
+            (name, repo.patient_id))
+
+
+def test_concurrent_expansion_creates_each_dose_once(database):
+    first = MedicineRepository(database, check_same_thread=False)
+    second = MedicineRepository(database, check_same_thread=False)
+    add_hourly_rule(first)
+    barrier = threading.Barrier(2)
+
+    def expand(repo):
+        barrier.wait()
+        repo.expand_rules(NOW)
+
+    threads = [threading.Thread(target=expand, args=(repo,))
+               for repo in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows, distinct = first.query_one(
+        "SELECT COUNT(*), COUNT(DISTINCT due_at) FROM medicines")
+    assert rows == distinct == 7 * 24 + 1
+    assert first.query_one(
+        "SELECT quantity FROM inventory")[0] == 1000 - rows
+    first.close()
+    second.close()
+
+
+def test_expansion_is_idempotent(repo):
+    add_hourly_rule(repo)
+    created = repo.expand_rules(NOW)
+    assert created == 7 * 24 + 1
+    assert repo.expand_rules(NOW) == 0
+
+
+def test_add_rule_rejects_rule_that_does_not_fit_stock(repo):
+    import pytest
+
+    repo.add_inventory_item("Аспирин", 10)
+    start = datetime.date.today() + datetime.timedelta(days=1)
+    with pytest.raises(ValueError):
+        repo.add_rule("Аспирин", 1, start.isoformat(), "08:00", 60)
+    assert repo.query_one("SELECT COUNT(*) FROM medicine_rules")[0] == 0
+    assert repo.query_one("SELECT COUNT(*) FROM medicines")[0] == 0
+    assert repo.stock_level("Аспирин") == 10
+
+
+def test_add_rule_reserves_first_batch(repo):
+    repo.add_inventory_item("Аспирин", 100)
+    start = datetime.date.today() + datetime.timedelta(days=1)
+    repo.add_rule("Аспирин", 2, start.isoformat(), "08:00", 24 * 60)
+    doses = repo.query_one("SELECT COUNT(*) FROM medicines")[0]
+    assert doses > 0
+    assert repo.stock_level("Аспирин") == 100 - 2 * doses
+
+
+def test_expansion_stops_when_stock_runs_out(repo):
+    add_hourly_rule(repo, stock=10)
+    assert repo.expand_rules(NOW) == 10
+    assert repo.query_one("SELECT quantity FROM inventory")[0] == 0
+    assert repo.expand_rules(NOW) == 0
+
+    inventory_id = repo.query_one("SELECT id FROM inventory")[0]
+    repo.update_inventory_item(inventory_id, "Аспирин", 20)
+    assert repo.expand_rules(NOW) == 20
+    rows, distinct = repo.query_one(
+        "SELECT COUNT(*), COUNT(DISTINCT due_at) FROM medicines")
+    assert rows == distinct == 30
+
+
+def count_write_locks(repo):
+    statements = []
+    repo.conn.set_trace_callback(statements.append)
+    return lambda: sum(statement == "BEGIN IMMEDIATE"
+                       for statement in statements)
+
+
+def test_finished_rule_is_not_expanded_again(repo):
+    repo.add_inventory_item("Аспирин", 1000)
+    with repo.transaction() as conn:
+        conn.execute(
+            "INSERT INTO medicine_rules (name, dosage, start_date, start_time, interval_minutes, end_date, patient_id) VALUES ('Аспирин', 1, '2020-01-01', '08:00', 60, '2020-01-31', 1)")
+    locks = count_write_locks(repo)
+    for _ in range(3):
+        assert repo.expand_rules(NOW) == 0
+    assert locks() <= 1
+    assert repo.query_one("SELECT expanded_until FROM medicine_rules")[0] == \
+        "2020-01-31 23:59"
+
+
+def test_rule_without_stock_does_not_take_the_write_lock(repo):
+    add_hourly_rule(repo, stock=0)
+    locks = count_write_locks(repo)
+    for _ in range(3):
+        assert repo.expand_rules(NOW) == 0
+    assert locks() == 0
+
+
+def test_rule_expanded_to_the_horizon_does_not_take_the_write_lock(repo):
+    repo.add_inventory_item("Аспирин", 1000)
+    with repo.transaction() as conn:
+        conn.execute(
+            "INSERT INTO medicine_rules (name, dosage, start_date, start_time, interval_minutes, patient_id) VALUES ('Аспирин', 1, '2030-01-01', '08:00', 1440, 1)")
+    assert repo.expand_rules(NOW) == 8
+    locks = count_write_locks(repo)
+    # Следующий повтор наступит только через сутки после горизонта.
+    for minutes in (1, 30, 60):
+        assert repo.expand_rules(NOW + datetime.timedelta(minutes=minutes)) == 0
+    assert locks() == 0
@@ -0,0 +1,57 @@
+import pytest
+from PyQt6.QtCore import Qt
+
+
+def load_all(model):
+    while model.canFetchMore():
+        model.fetchMore()
+    return model.rowCount()
+
+
+@pytest.mark.parametrize("order", [Qt.SortOrder.AscendingOrder,
+                                   Qt.SortOrder.DescendingOrder])
+@pytest.mark.parametrize("column", [2, 3])
+def test_inventory_pages_past_empty_forecast(main_window, order, column):
+    import windows
+
+    repo = main_window.repo
+    with repo.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO inventory (name, quantity, patient_id) VALUES (?, 0, ?)",
+            ((f"Лекарство {i:03}", repo.patient_id) for i in range(450)))
+        # У части лекарств есть приемы, и прогноз не пустой.
+        conn.executemany(
+            "INSERT INTO medicines (name, dosage, date, time, due_at, patient_id) VALUES (?, 1, '2030-01-01', '08:00', 1893484800, ?)",
+            ((f"Лекарство {i:03}", repo.patient_id) for i in range(0, 450, 3)))
+    repo.refresh_patient_forecast()
+
+    window = windows.InventoryWindow(main_window)
+    model = window.inventory_model
+    model.sort(column, order)
+    assert load_all(model) == 450
+    assert len({model.row_id(row) for row in range(450)}) == 450
+
+
+def test_cancel_survives_search_finishing_concurrently(main_window):
+    import windows
+
+    class FinishingTask:
+        # Поток поиска обнуляет conn сразу после первого чтения.
+        def __init__(self):
+            self.reads = 0
+            self.interrupted = False
+
+        @property
+        def conn(self):
+            self.reads += 1
+            return self if self.reads == 1 else None
+
+        def interrupt(self):
+            self.interrupted = True
+
+    window = windows.InventoryWindow(main_window)
+    controller = window.search_controller
+    controller.task = task = FinishingTask()
+    controller.cancel()
+    assert task.interrupted
+    assert controller.task is None
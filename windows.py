@@ -0,0 +1,1641 @@
+import datetime
+import sqlite3
+import sys
+import threading
+
+from PyQt6.QtCore import (
+    Qt, pyqtSignal, QDate, QTime, QTimer, QSize,
+    QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool,
+)
+from PyQt6.QtGui import QFont, QIcon
+from PyQt6.QtWidgets import (
+    QWidget,
+    QLabel,
+    QPushButton,
+    QVBoxLayout,
+    QHBoxLayout,
+    QGridLayout,
+    QComboBox,
+    QLineEdit,
+    QDateEdit,
+    QTimeEdit,
+    QMessageBox,
+    QTableView,
+    QDialog,
+    QSpinBox,
+    QScrollArea,
+    QInputDialog, QSizePolicy, QFileDialog, QCheckBox,
+    QTableWidget, QTableWidgetItem,
+)
+
+import adherence
+import archive
+import assets
+import bulk_io
+import instrumentation
+import repository
+from repository import search_filter
+
+
+def sql_order(value):
+    # Порядок значений как в ORDER BY SQLite: NULL, числа, строки.
+    if value is None:
+        return (0,)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, value)
+
+
+class SqlTableModel(QAbstractTableModel):
+    CHUNK_SIZE = 200
+    # Если изменилось больше строк, загруженный диапазон перечитывается целиком.
+    MAX_UPDATED_IDS = 500
+
+    def __init__(self, conn, table, columns, sort_keys=None, sort_column=0,
+                 sort_order=Qt.SortOrder.AscendingOrder, scope=None,
+                 source=None):
+        super().__init__()
+        self.conn = conn
+        self.table = table
+        # Таблица, об изменениях которой сообщает репозиторий (модель может
+        # читать представление поверх нее).
+        self.source = source or table
+        # Постоянное условие выборки (пациент), к нему добавляется поиск.
+        self.scope = scope
+        self.columns = [column for column, _ in columns]
+        self.headers = [header for _, header in columns]
+        self.sort_keys = sort_keys or {}
+        self.sort_column = sort_column
+        self.sort_order = sort_order
+        self.filter_sql = ""
+        self.filter_params = ()
+        self.rows = []
+        self.exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        if (role == Qt.ItemDataRole.DisplayRole
+                and orientation == Qt.Orientation.Horizontal):
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            value = row[index.column() + 1]
+            return "" if value is None else str(value)
+        if role == Qt.ItemDataRole.UserRole:
+            return row[0]
+        return None
+
+    def row_id(self, row):
+        return self.rows[row][0]
+
+    def row_values(self, row):
+        return self.rows[row][1:len(self.columns) + 1]
+
+    def order_keys(self):
+        keys = self.sort_keys.get(self.sort_column,
+                                  (self.columns[self.sort_column],))
+        return list(keys) + ["id"]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def chunk_query(self, filter_sql, filter_params, last_row=None,
+                    until_row=None, ids=None, limit=None):
+        keys = self.order_keys()
+        descending = self.sort_order == Qt.SortOrder.DescendingOrder
+        direction = "DESC" if descending else "ASC"
+
+        conditions = []
+        params = []
+        if self.scope is not None:
+            conditions.append(self.scope[0])
+            params.extend(self.scope[1])
+        if filter_sql:
+            conditions.append(f"({filter_sql})")
+            params.extend(filter_params)
+        if last_row is not None:
+            # Следующая порция начинается сразу после последней загруженной
+            # строки, поэтому запрос не пересчитывает уже показанные строки.
+            conditions.append(
+                f"({', '.join(keys)}) {'<' if descending else '>'} "
+                f"({', '.join('?' * len(keys))})")
+            params.extend(last_row[len(self.columns) + 1:])
+        if until_row is not None:
+            conditions.append(
+                f"({', '.join(keys)}) {'>=' if descending else '<='} "
+                f"({', '.join('?' * len(keys))})")
+            params.extend(until_row[len(self.columns) + 1:])
+        if ids is not None:
+            conditions.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+
+        sql = (f"SELECT id, {', '.join(self.columns)}, {', '.join(keys)} "
+               f"FROM {self.table}")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += (" ORDER BY " + ", ".join(f"{key} {direction}" for key in keys)
+                + f" LIMIT {self.CHUNK_SIZE if limit is None else limit}")
+        return sql, params
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        sql, params = self.chunk_query(self.filter_sql, self.filter_params,
+                                       self.rows[-1] if self.rows else None)
+        self.append_rows(self.conn.execute(sql, params).fetchall())
+
+    def append_rows(self, rows):
+        self.exhausted = len(rows) < self.CHUNK_SIZE
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows),
+                                 len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def refresh(self, first_chunk=None):
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+        if first_chunk is None:
+            self.fetchMore()
+        else:
+            self.append_rows(first_chunk)
+
+    def row_key(self, row):
+        return tuple(sql_order(value) for value in row[len(self.columns) + 1:])
+
+    def precedes(self, first, second):
+        if self.sort_order == Qt.SortOrder.DescendingOrder:
+            return first > second
+        return first < second
+
+    def apply_changes(self, changes):
+        # changes — словарь «таблица -> id строк» от репозитория или None,
+        # если базу изменил другой процесс и строки неизвестны.
+        if changes is not None and self.source not in changes:
+            return
+        ids = None if changes is None else changes[self.source]
+        if ids is None or len(ids) > self.MAX_UPDATED_IDS:
+            self.sync()
+        else:
+            self.update_rows(ids)
+
+    def update_rows(self, ids):
+        # Перечитываются только строки с указанными id, новые строки
+        # вставляются, если попадают в уже загруженный диапазон.
+        if not ids or (not self.rows and not self.exhausted):
+            return
+        ids = list(ids)
+        sql, params = self.chunk_query(self.filter_sql, self.filter_params,
+                                       ids=ids, limit=-1)
+        found = self.conn.execute(sql, params).fetchall()
+        changed = set(ids)
+        fresh = [row for row in self.rows if row[0] not in changed]
+        boundary = None if self.exhausted else self.row_key(self.rows[-1])
+        fresh.extend(row for row in found
+                     if boundary is None
+                     or not self.precedes(boundary, self.row_key(row)))
+        fresh.sort(key=self.row_key,
+                   reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+        self.apply_rows(fresh)
+
+    def sync(self):
+        # Загруженный диапазон перечитывается одним запросом до последней
+        # показанной строки, модель получает сигналы только о разнице.
+        if not self.rows and not self.exhausted:
+            return
+        until_row = None if self.exhausted else self.rows[-1]
+        sql, params = self.chunk_query(self.filter_sql, self.filter_params,
+                                       until_row=until_row, limit=-1)
+        self.apply_rows(self.conn.execute(sql, params).fetchall())
+
+    def apply_rows(self, fresh):
+        # Слияние двух упорядоченных списков: удаленные строки убираются,
+        # новые вставляются на свое место, у измененных обновляются ячейки.
+        old = new = 0
+        while old < len(self.rows) or new < len(fresh):
+            if new < len(fresh) and old < len(self.rows):
+                current, candidate = self.rows[old], fresh[new]
+                current_key = self.row_key(current)
+                candidate_key = self.row_key(candidate)
+                if current_key == candidate_key:
+                    if current != candidate:
+                        self.rows[old] = candidate
+                        self.dataChanged.emit(
+                            self.index(old, 0),
+                            self.index(old, len(self.columns) - 1))
+                    old += 1
+                    new += 1
+                    continue
+                removed = self.precedes(current_key, candidate_key)
+            else:
+                removed = new == len(fresh)
+            if removed:
+                self.beginRemoveRows(QModelIndex(), old, old)
+                del self.rows[old]
+                self.endRemoveRows()
+            else:
+                self.beginInsertRows(QModelIndex(), old, old)
+                self.rows.insert(old, fresh[new])
+                self.endInsertRows()
+                old += 1
+                new += 1
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.refresh()
+
+    def set_filter(self, sql="", params=(), first_chunk=None):
+        self.filter_sql = sql
+        self.filter_params = params
+        self.refresh(first_chunk)
+
+
+class SearchTask(QRunnable):
+    connections = threading.local()
+
+    def __init__(self, controller, generation, sql, params,
+                 with_archives=False):
+        super().__init__()
+        self.controller = controller
+        self.generation = generation
+        self.sql = sql
+        self.params = params
+        self.with_archives = with_archives
+        self.conn = None
+
+    def connection(self):
+        conn = getattr(self.connections, "conn", None)
+        if conn is None:
+            conn = repository.connect(self.controller.database,
+                                      check_same_thread=False)
+            self.connections.conn = conn
+        return conn
+
+    def run(self):
+        if self.generation != self.controller.generation:
+            return
+        self.conn = self.connection()
+        try:
+            if self.with_archives:
+                archive.attach_archives(self.conn)
+            else:
+                archive.detach_archives(self.conn)
+            rows = self.conn.execute(self.sql, self.params).fetchall()
+        except sqlite3.Error:
+            rows = None
+        finally:
+            self.conn = None
+        if self.generation != self.controller.generation:
+            return
+        try:
+            self.controller.result_ready.emit(self.generation, rows)
+        except RuntimeError:
+            pass
+
+
+class SearchController(QObject):
+    DEBOUNCE_INTERVAL = 250
+    result_ready = pyqtSignal(int, object)
+    pool = None
+
+    def __init__(self, model, table, database):
+        super().__init__()
+        self.model = model
+        self.table = table
+        self.database = database
+        self.schemas = ("main",)
+        self.text = ""
+        self.generation = 0
+        self.task = None
+        self.request = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.DEBOUNCE_INTERVAL)
+        self.timer.timeout.connect(self.start_search)
+        self.result_ready.connect(self.apply_result)
+        if SearchController.pool is None:
+            SearchController.pool = QThreadPool()
+            SearchController.pool.setMaxThreadCount(2)
+
+    def search(self, text):
+        self.text = text
+        self.timer.start()
+
+    def cancel(self):
+        self.generation += 1
+        # Поток поиска обнуляет conn по окончании запроса, поэтому
+        # соединение читается один раз.
+        conn = self.task.conn if self.task is not None else None
+        if conn is not None:
+            conn.interrupt()
+        self.task = None
+
+    def start_search(self):
+        self.cancel()
+        filter_sql, filter_params = search_filter(self.table, self.text,
+                                                  self.schemas)
+        sql, params = self.model.chunk_query(filter_sql, filter_params)
+        self.request = (filter_sql, filter_params, self.model.table,
+                        self.model.sort_column, self.model.sort_order)
+        self.task = SearchTask(self, self.generation, sql, tuple(params),
+                               with_archives=len(self.schemas) > 1)
+        self.pool.start(self.task)
+
+    def apply_result(self, generation, rows):
+        if generation != self.generation:
+            return
+        self.task = None
+        filter_sql, filter_params, table, sort_column, sort_order = self.request
+        if (table, sort_column, sort_order) != (self.model.table,
+                                                self.model.sort_column,
+                                                self.model.sort_order):
+            rows = None
+        self.model.set_filter(filter_sql, filter_params, rows)
+
+
+class AddMedicineWindow(QDialog):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowTitle("Добавить прием")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setStyleSheet(assets.background_style("images/addmed.jpg"))
+        self.main_window = main_window
+        self.medicine_list = self.get_medicine_list()
+        self.repeat = None
+
+        medicine_label = QLabel("Лекарство:")
+        self.medicine_combobox = QComboBox()
+        self.medicine_combobox.addItems(sorted(self.medicine_list))
+        self.medicine_combobox.setEditable(True)
+
+        dosage_label = QLabel("Дозировка:")
+        self.dosage_spinbox = QSpinBox()
+        self.dosage_spinbox.setMinimum(1)
+
+        date_label = QLabel("Дата:")
+        self.date_edit = QDateEdit()
+        self.date_edit.setDate(QDate.currentDate())
+
+        time_label = QLabel("Время:")
+        self.time_edit = QTimeEdit()
+        self.time_edit.setTime(QTime.currentTime())
+
+        self.repeat_label = QLabel("Без повтора")
+        repeat_button = QPushButton("Повторять...")
+        repeat_button.clicked.connect(self.open_repeat_dialog)
+
+        save_button = QPushButton("Сохранить")
+        save_button.clicked.connect(self.save_medicine)
+
+        layout = QGridLayout()
+        layout.addWidget(medicine_label, 0, 0)
+        layout.addWidget(self.medicine_combobox, 0, 1)
+        layout.addWidget(dosage_label, 1, 0)
+        layout.addWidget(self.dosage_spinbox, 1, 1)
+        layout.addWidget(date_label, 2, 0)
+        layout.addWidget(self.date_edit, 2, 1)
+        layout.addWidget(time_label, 3, 0)
+        layout.addWidget(self.time_edit, 3, 1)
+        layout.addWidget(self.repeat_label, 4, 0)
+        layout.addWidget(repeat_button, 4, 1)
+        layout.addWidget(save_button, 5, 0, 1, 2)
+        self.setLayout(layout)
+
+    def open_repeat_dialog(self):
+        self.repeat_dialog = RepeatDialog(self)
+        self.repeat_dialog.repeat_signal.connect(self.set_repeat)
+        self.repeat_dialog.show()
+
+    def set_repeat(self, repeat_values):
+        interval = (repeat_values["days"] * 24 * 60
+                    + repeat_values["hours"] * 60 + repeat_values["minutes"])
+        if interval <= 0:
+            self.repeat = None
+            self.repeat_label.setText("Без повтора")
+            return
+        self.repeat = {"interval": interval, "until": repeat_values["until"],
+                       "course": repeat_values["course"],
+                       "count": repeat_values["count"] or None}
+        text = (f"Каждые {repeat_values['days']} д. {repeat_values['hours']} ч. "
+                f"{repeat_values['minutes']} мин. ")
+        if repeat_values["course"] and repeat_values["count"]:
+            text += f"{repeat_values['count']} раз"
+        else:
+            text += f"до {repeat_values['until']}"
+        if repeat_values["course"]:
+            text += ", курсом"
+        self.repeat_label.setText(text)
+
+    def save_medicine(self):
+        medicine_name = self.medicine_combobox.currentText()
+        dosage = self.dosage_spinbox.value()
+        date = self.date_edit.date().toString("yyyy-MM-dd")
+        time = self.time_edit.time().toString("HH:mm")
+
+        if not medicine_name:
+            QMessageBox.warning(self, "Ошибка", "Введите название лекарства!")
+            return
+
+        inventory_level = self.check_inventory(medicine_name)
+        if inventory_level is None:
+            QMessageBox.warning(self, "Ошибка",
+                                f"Лекарство '{medicine_name}' отсутствует на складе. Добавьте его в запасы.")
+            return
+        elif dosage > inventory_level:
+            QMessageBox.warning(self, "Ошибка",
+                                f"Недостаточно лекарства '{medicine_name}' на складе. Требуется {dosage}, а есть {inventory_level}.")
+            return
+
+        current_datetime = datetime.datetime.now()
+        entered_datetime = datetime.datetime.strptime(date + " " + time,
+                                                      "%Y-%m-%d %H:%M")
+
+        if entered_datetime >= current_datetime:
+            try:
+                if self.repeat is None:
+                    self.main_window.repo.schedule_dose(medicine_name, dosage,
+                                                        date, time)
+                elif self.repeat["course"]:
+                    self.main_window.repo.schedule_course(
+                        medicine_name, dosage, date, time,
+                        self.repeat["interval"], self.repeat["count"],
+                        None if self.repeat["count"] else self.repeat["until"])
+                else:
+                    self.main_window.repo.add_rule(
+                        medicine_name, dosage, date, time,
+                        self.repeat["interval"], self.repeat["until"])
+                self.main_window.schedule_changed()
+                self.check_and_notify_zero_inventory(medicine_name)
+                self.close()
+            except ValueError as e:
+                QMessageBox.warning(self, "Ошибка", str(e))
+            except sqlite3.IntegrityError as e:
+                QMessageBox.critical(self, "Ошибка",
+                                     f"Ошибка добавления приема: {e}")
+            except sqlite3.Error as e:
+                QMessageBox.critical(self, "Ошибка",
+                                     f"Ошибка базы данных: {e}")
+            except Exception as e:
+                QMessageBox.critical(self, "Ошибка",
+                                     f"Произошла неизвестная ошибка: {e}")
+                import traceback
+                traceback.print_exc()
+        else:
+            QMessageBox.warning(self, "Ошибка",
+                                "Время приема не может быть раньше текущего времени")
+
+    def check_and_notify_zero_inventory(self, medicine_name):
+        try:
+            quantity = self.main_window.repo.stock_level(medicine_name)
+            if quantity is not None and quantity <= 0:
+                self.main_window.notifier.notify(
+                    "Уведомление",
+                    f"Лекарство '{medicine_name}' закончилось.")
+        except (sqlite3.Error, IndexError) as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка проверки запасов: {e}")
+
+    def get_medicine_list(self):
+        medicine_list = set()
+        medicine_list.update(
+            self.main_window.get_medicine_history())
+        medicine_list.update(
+            self.get_medicines_from_inventory())
+        return list(medicine_list)
+
+    def get_medicines_from_inventory(self):
+        return self.main_window.repo.inventory_names()
+
+    def check_inventory(self, medicine_name):
+        return self.main_window.repo.stock_level(medicine_name)
+
+
+class ScheduleWindow(QWidget):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowTitle("График приема")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setStyleSheet(assets.background_style("images/shedule.jpg"))
+        self.setGeometry(100, 100, 450, 300)
+        self.main_window = main_window
+        self.selected_row = None
+
+        self.cancel_button = QPushButton("Отменить прием")
+        self.cancel_button.clicked.connect(self.cancel_medicine)
+        self.cancel_button.setEnabled(False)
+
+        self.schedule_model = SqlTableModel(
+            self.main_window.repo.conn, "medicines",
+            [("name", "Лекарство"), ("dosage", "Дозировка"),
+             ("date", "Дата"), ("time", "Время")],
+            sort_keys={2: ("date", "time"), 3: ("time", "date")},
+            sort_column=2,
+            scope=self.main_window.repo.patient_scope(),
+        )
+        self.schedule_table = QTableView()
+        self.schedule_table.setModel(self.schedule_model)
+        self.schedule_table.setSelectionBehavior(
+            QTableView.SelectionBehavior.SelectRows)
+        self.schedule_table.setSelectionMode(
+            QTableView.SelectionMode.SingleSelection)
+        self.schedule_table.horizontalHeader().setSortIndicator(
+            2, Qt.SortOrder.AscendingOrder)
+        self.schedule_table.setSortingEnabled(True)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск...")
+        self.search_controller = SearchController(
+            self.schedule_model, "medicines", self.main_window.repo.database)
+        self.search_edit.textChanged.connect(self.search_controller.search)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.search_edit)
+        layout.addWidget(self.schedule_table)
+        layout.addWidget(self.cancel_button)
+
+        self.setLayout(layout)
+
+        self.schedule_table.selectionModel().selectionChanged.connect(
+            self.handle_selection_changed)
+        self.schedule_model.modelReset.connect(self.handle_model_reset)
+        self.schedule_model.rowsInserted.connect(self.sync_selection)
+        self.schedule_model.rowsRemoved.connect(self.sync_selection)
+        self.main_window.change_bus.changed.connect(self.data_changed)
+
+    def update_table(self):
+        self.schedule_model.refresh()
+
+    def data_changed(self, changes):
+        # Скрытое окно не обновляется, при следующем открытии оно
+        # создается заново.
+        if not self.isVisible():
+            return
+        try:
+            self.schedule_model.apply_changes(changes)
+        except sqlite3.Error as e:
+            print(f"Ошибка обновления графика: {e}", file=sys.stderr)
+
+    def update_data(self, medicine_data):
+        if self.selected_row is not None:
+            medicine_id = self.schedule_model.row_id(self.selected_row)
+            try:
+                self.main_window.repo.update_dose(
+                    medicine_id,
+                    medicine_data["name"],
+                    medicine_data["dosage"],
+                    medicine_data["date"],
+                    medicine_data["time"],
+                )
+            except ValueError as e:
+                QMessageBox.warning(self, "Ошибка", str(e))
+                return
+            self.main_window.schedule_changed()
+
+    def handle_selection_changed(self, selected, deselected):
+        self.selected_row = selected.indexes()[
+            0].row() if selected.indexes() else None
+        self.cancel_button.setEnabled(self.selected_row is not None)
+
+    def sync_selection(self):
+        # Вставленные или удаленные строки сдвигают выделенную строку.
+        rows = self.schedule_table.selectionModel().selectedRows()
+        self.selected_row = rows[0].row() if rows else None
+        self.cancel_button.setEnabled(self.selected_row is not None)
+
+    def handle_model_reset(self):
+        self.selected_row = None
+        self.cancel_button.setEnabled(False)
+
+    def cancel_medicine(self):
+        if self.selected_row is not None:
+            medicine_id = self.schedule_model.row_id(self.selected_row)
+            if QMessageBox.question(
+                    self,
+                    "Отмена приема",
+                    "Вы уверены, что хотите отменить этот прием?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                    QMessageBox.StandardButton.No,
+            ) == QMessageBox.StandardButton.Yes:
+                try:
+                    rule_id = self.main_window.repo.dose_rule(medicine_id)
+                    if rule_id is not None and QMessageBox.question(
+                            self,
+                            "Отмена приема",
+                            "Этот прием входит в курс. Отменить все оставшиеся приемы курса?",
+                            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                            QMessageBox.StandardButton.No,
+                    ) == QMessageBox.StandardButton.Yes:
+                        self.main_window.repo.cancel_rule(rule_id)
+                    else:
+                        self.main_window.repo.cancel_dose(medicine_id)
+                    self.main_window.schedule_changed()
+                except ValueError:
+                    QMessageBox.critical(self, "Ошибка",
+                                         "Неверный формат дозировки. Дозировка должна быть целым числом.")
+                except sqlite3.Error as e:
+                    QMessageBox.critical(self, "Ошибка",
+                                         f"Ошибка отмены приема или обновления запасов: {e}")
+                except Exception as e:
+                    QMessageBox.critical(self, "Ошибка",
+                                         f"Неизвестная ошибка: {e}")
+
+    def search_schedule(self, text):
+        self.schedule_model.set_filter(*search_filter("medicines", text))
+
+
+class EditMedicineDialog(QDialog):
+    data_changed = pyqtSignal(dict)
+
+    def __init__(self, medicine_data, main_window):
+        super().__init__()
+        self.setWindowTitle("Редактировать событие")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setGeometry(100, 100, 300, 200)
+        self.main_window = main_window
+
+        self.medicine_history = self.main_window.get_medicine_history()
+
+        medicine_label = QLabel("Лекарство:")
+        self.medicine_combobox = QComboBox()
+        self.medicine_combobox.addItems(self.medicine_history)
+        self.medicine_combobox.setEditable(True)
+        self.medicine_combobox.setCurrentText(medicine_data[1])
+
+        dosage_label = QLabel("Дозировка:")
+        self.dosage_edit = QLineEdit(medicine_data[2])
+
+        date_label = QLabel("Дата:")
+        self.date_edit = QDateEdit()
+        self.date_edit.setDate(
+            QDate.fromString(medicine_data[3], "yyyy-MM-dd"))
+
+        time_label = QLabel("Время:")
+        self.time_edit = QTimeEdit()
+        self.time_edit.setTime(QTime.fromString(medicine_data[4], "HH:mm"))
+
+        save_button = QPushButton("Сохранить")
+        save_button.clicked.connect(self.save_changes)
+
+        layout = QGridLayout()
+        layout.addWidget(medicine_label, 0, 0)
+        layout.addWidget(self.medicine_combobox, 0, 1)
+        layout.addWidget(dosage_label, 1, 0)
+        layout.addWidget(self.dosage_edit, 1, 1)
+        layout.addWidget(date_label, 2, 0)
+        layout.addWidget(self.date_edit, 2, 1)
+        layout.addWidget(time_label, 3, 0)
+        layout.addWidget(self.time_edit, 3, 1)
+        layout.addWidget(save_button, 4, 0, 1, 2)
+
+        self.setLayout(layout)
+
+    def save_changes(self):
+
+        medicine_name = self.medicine_combobox.currentText()
+        dosage = self.dosage_edit.text()
+        date = self.date_edit.date().toString("yyyy-MM-dd")
+        time = self.time_edit.time().toString("HH:mm")
+        if not medicine_name.strip():
+            QMessageBox.warning(self, "Ошибка",
+                                "Введите корректное название лекарства")
+            return
+
+        if not dosage.strip() or not dosage.isdigit() or int(dosage) <= 0:
+            QMessageBox.warning(self, "Ошибка",
+                                "Введите корректную дозировку лекарства")
+            return
+
+        current_datetime = datetime.datetime.now()
+        selected_datetime = datetime.datetime.strptime(f"{date} {time}",
+                                                       "%Y-%m-%d %H:%M")
+        if selected_datetime < current_datetime:
+            QMessageBox.warning(self, "Ошибка",
+                                "Выберите корректную дату и время")
+            return
+
+        medicine_data = {
+            "name": medicine_name,
+            "dosage": dosage,
+            "date": date,
+            "time": time,
+        }
+        self.data_changed.emit(medicine_data)
+        self.close()
+
+
+class RepeatDialog(QDialog):
+    repeat_signal = pyqtSignal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Повторить прием")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setGeometry(100, 100, 200, 150)
+        days_label = QLabel("Дней:")
+        self.days_spinbox = QSpinBox()
+        self.days_spinbox.setMinimum(0)
+        self.days_spinbox.setMaximum(365)
+        hours_label = QLabel("Часов:")
+        self.hours_spinbox = QSpinBox()
+        self.hours_spinbox.setMinimum(0)
+        self.hours_spinbox.setMaximum(23)
+        minutes_label = QLabel("Минут:")
+        self.minutes_spinbox = QSpinBox()
+        self.minutes_spinbox.setMinimum(0)
+        self.minutes_spinbox.setMaximum(59)
+        until_label = QLabel("До:")
+        self.until_edit = QDateEdit()
+        self.until_edit.setDate(QDate.currentDate().addDays(30))
+        # Курс сразу появляется в расписании целиком и списывает запас
+        # на все приемы, правило повторения разворачивается по неделям.
+        self.course_checkbox = QCheckBox("Запланировать курсом сразу")
+        count_label = QLabel("Приемов:")
+        self.count_spinbox = QSpinBox()
+        self.count_spinbox.setMinimum(0)
+        self.count_spinbox.setMaximum(repository.MAX_COURSE_DOSES)
+        self.count_spinbox.setSpecialValueText("до даты")
+        self.count_spinbox.setEnabled(False)
+        self.course_checkbox.toggled.connect(self.count_spinbox.setEnabled)
+        save_button = QPushButton("Сохранить")
+        save_button.clicked.connect(self.save_repeat)
+        layout = QGridLayout()
+        layout.addWidget(days_label, 0, 0)
+        layout.addWidget(self.days_spinbox, 0, 1)
+        layout.addWidget(hours_label, 1, 0)
+        layout.addWidget(self.hours_spinbox, 1, 1)
+        layout.addWidget(minutes_label, 2, 0)
+        layout.addWidget(self.minutes_spinbox, 2, 1)
+        layout.addWidget(until_label, 3, 0)
+        layout.addWidget(self.until_edit, 3, 1)
+        layout.addWidget(self.course_checkbox, 4, 0, 1, 2)
+        layout.addWidget(count_label, 5, 0)
+        layout.addWidget(self.count_spinbox, 5, 1)
+        layout.addWidget(save_button, 6, 0, 1, 2)
+        self.setLayout(layout)
+
+    def save_repeat(self):
+        days = self.days_spinbox.value()
+        hours = self.hours_spinbox.value()
+        minutes = self.minutes_spinbox.value()
+        until = self.until_edit.date().toString("yyyy-MM-dd")
+        course = self.course_checkbox.isChecked()
+        repeat_values = {"days": days, "hours": hours, "minutes": minutes,
+                         "until": until, "course": course,
+                         "count": self.count_spinbox.value() if course else 0}
+        self.repeat_signal.emit(repeat_values)
+        self.close()
+
+
+class AddInventoryWindow(QWidget):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle("Добавить запас")
+        self.setStyleSheet(assets.background_style("images/addinv.jpg"))
+        self.setGeometry(100, 100, 300, 150)
+        self.main_window = main_window
+        self.medicine_history = self.main_window.get_medicine_history()
+        medicine_label = QLabel("Лекарство:")
+        self.medicine_combobox = QComboBox()
+        self.medicine_combobox.addItems(sorted(
+            self.medicine_history))
+        self.medicine_combobox.setEditable(True)
+        quantity_label = QLabel("Количество:")
+        self.quantity_spinbox = QSpinBox()
+        self.quantity_spinbox.setMinimum(1)
+        save_button = QPushButton("Сохранить")
+        save_button.clicked.connect(self.save_inventory)
+        layout = QGridLayout()
+        layout.addWidget(medicine_label, 0, 0)
+        layout.addWidget(self.medicine_combobox, 0, 1)
+        layout.addWidget(quantity_label, 1, 0)
+        layout.addWidget(self.quantity_spinbox, 1, 1)
+        layout.addWidget(save_button, 2, 0, 1, 2)
+        self.setLayout(layout)
+
+    def save_inventory(self):
+        medicine_name = self.medicine_combobox.currentText()
+        quantity = self.quantity_spinbox.value()
+
+        if not medicine_name:
+            QMessageBox.warning(self, "Ошибка", "Введите название лекарства!")
+            return
+
+        try:
+            existing_quantity = self.main_window.repo.stock_level(
+                medicine_name)
+
+            if existing_quantity is not None:
+                QMessageBox.information(
+                    self,
+                    "Лекарство уже существует",
+                    f"Лекарство '{medicine_name}' уже существует в запасах. Пополните запас в окне запасов."
+                )
+                return
+
+            else:
+                self.main_window.repo.add_inventory_item(medicine_name,
+                                                         quantity)
+                self.close()
+
+        except sqlite3.IntegrityError as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Лекарство с таким названием уже существует: {e}")
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка базы данных: {e}")
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Произошла неизвестная ошибка: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+class InventoryWindow(QWidget):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowTitle("Запасы лекарств")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setStyleSheet(assets.background_style("images/invent.jpg"))
+        self.setGeometry(100, 100, 560, 300)
+        self.main_window = main_window
+        self.selected_row = None
+        self.editing_id = None
+        # Даты прогноза берутся из представления, которое соединяет запасы
+        # с заранее посчитанной таблицей stock_forecast.
+        self.inventory_model = SqlTableModel(
+            self.main_window.repo.conn, "inventory_forecast",
+            [("name", "Лекарство"), ("quantity", "Количество"),
+             ("runs_out_on", "Закончится"), ("reorder_on", "Купить до")],
+            # Сравнение строк-значений с NULL дает NULL, и порции по
+            # датам прогноза без IFNULL обрывались бы на первой пустой.
+            sort_keys={2: ("IFNULL(runs_out_on, '')",),
+                       3: ("IFNULL(reorder_on, '')",)},
+            scope=self.main_window.repo.patient_scope(),
+            source="inventory",
+        )
+        self.inventory_table = QTableView()
+        self.inventory_table.setModel(self.inventory_model)
+        self.inventory_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.inventory_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.inventory_table.horizontalHeader().setSortIndicator(
+            0, Qt.SortOrder.AscendingOrder)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск...")
+        self.search_controller = SearchController(
+            self.inventory_model, "inventory", self.main_window.repo.database)
+        self.search_edit.textChanged.connect(self.search_controller.search)
+        self.delete_button = QPushButton("Удалить")
+        self.delete_button.clicked.connect(self.delete_inventory_item)
+        self.delete_button.setEnabled(False)
+        self.edit_button = QPushButton("Изменить")
+        self.edit_button.clicked.connect(self.edit_inventory_item)
+        self.edit_button.setEnabled(False)
+        self.history_button = QPushButton("История")
+        self.history_button.clicked.connect(self.open_history)
+        self.history_button.setEnabled(False)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.search_edit)
+        layout.addWidget(self.inventory_table)
+        self.import_button = QPushButton("Импорт...")
+        self.import_button.clicked.connect(self.import_inventory)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.delete_button)
+        button_layout.addWidget(self.edit_button)
+        button_layout.addWidget(self.history_button)
+        button_layout.addWidget(self.import_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+        self.inventory_table.selectionModel().selectionChanged.connect(
+            self.handle_selection_changed
+        )
+        self.inventory_model.modelReset.connect(self.handle_model_reset)
+        self.inventory_model.rowsInserted.connect(self.sync_selection)
+        self.inventory_model.rowsRemoved.connect(self.sync_selection)
+        self.inventory_table.setSortingEnabled(True)
+        self.main_window.change_bus.changed.connect(self.data_changed)
+
+    def update_table(self):
+        try:
+            self.inventory_model.refresh()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Ошибка при загрузке данных: {e}")
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Произошла неизвестная ошибка: {e}")
+
+    def data_changed(self, changes):
+        if not self.isVisible():
+            return
+        try:
+            self.inventory_model.apply_changes(changes)
+        except sqlite3.Error as e:
+            print(f"Ошибка обновления запасов: {e}", file=sys.stderr)
+
+    def delete_inventory_item(self):
+        if self.selected_row is not None:
+            if QMessageBox.question(
+                    self,
+                    "Удаление",
+                    "Вы уверены, что хотите удалить этот элемент?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                    QMessageBox.StandardButton.No,
+            ) == QMessageBox.StandardButton.Yes:
+                inventory_id = self.inventory_model.row_id(
+                    self.selected_row)
+                self.main_window.repo.delete_inventory_item(inventory_id)
+
+    def edit_inventory_item(self):
+        if self.selected_row is not None:
+            inventory_id = self.inventory_model.row_id(self.selected_row)
+            self.editing_id = inventory_id
+            inventory_item = self.main_window.repo.get_inventory_item(
+                inventory_id)
+            self.edit_dialog = EditInventoryDialog(
+                inventory_item, self.main_window
+            )
+            self.edit_dialog.setWindowTitle("Редактировать элемент")
+
+            self.edit_dialog.data_changed.connect(self.update_data)
+
+            self.edit_dialog.show()
+
+    def update_data(self, inventory_data):
+        inventory_id = self.editing_id
+        if inventory_id is not None:
+            try:
+                self.main_window.repo.update_inventory_item(
+                    inventory_id,
+                    inventory_data["name"],
+                    inventory_data["quantity"],
+                )
+            except sqlite3.IntegrityError:
+                QMessageBox.warning(
+                    self, "Ошибка",
+                    f"Лекарство '{inventory_data['name']}' уже есть в запасах.")
+
+    def import_inventory(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Импорт запасов", "",
+            "Таблицы (*.csv *.jsonl *.ndjson *.json)")
+        if not path:
+            return
+        try:
+            report = bulk_io.import_file(self.main_window.repo, "inventory",
+                                         path)
+        except (OSError, UnicodeDecodeError, sqlite3.Error) as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка импорта: {e}")
+            return
+        message = f"Загружено записей: {report.imported}."
+        if report.rejected:
+            report_path = path + ".rejected.csv"
+            bulk_io.write_rejected(report, report_path)
+            message += (f"\nОтклонено: {len(report.rejected)}, "
+                        f"подробности в файле {report_path}")
+        QMessageBox.information(self, "Импорт запасов", message)
+
+    def open_history(self):
+        if self.selected_row is not None:
+            inventory_id = self.inventory_model.row_id(self.selected_row)
+            name = self.inventory_model.row_values(self.selected_row)[0]
+            self.history_window = StockHistoryWindow(
+                self.main_window, inventory_id, name)
+            self.history_window.show()
+
+    def search_inventory(self, text):
+        self.inventory_model.set_filter(*search_filter("inventory", text))
+
+    def handle_selection_changed(self, selected, deselected):
+        self.selected_row = selected.indexes()[
+            0].row() if selected.indexes() else None
+        self.delete_button.setEnabled(self.selected_row is not None)
+        self.edit_button.setEnabled(self.selected_row is not None)
+        self.history_button.setEnabled(self.selected_row is not None)
+
+    def sync_selection(self):
+        rows = self.inventory_table.selectionModel().selectedRows()
+        self.selected_row = rows[0].row() if rows else None
+        self.delete_button.setEnabled(self.selected_row is not None)
+        self.edit_button.setEnabled(self.selected_row is not None)
+        self.history_button.setEnabled(self.selected_row is not None)
+
+    def handle_model_reset(self):
+        self.selected_row = None
+        self.delete_button.setEnabled(False)
+        self.edit_button.setEnabled(False)
+        self.history_button.setEnabled(False)
+
+
+class StockHistoryWindow(QWidget):
+    def __init__(self, main_window, inventory_id, name):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle(f"История запасов: {name}")
+        self.setGeometry(100, 100, 450, 400)
+        self.main_window = main_window
+        self.inventory_id = inventory_id
+
+        # Записи читаются порциями по индексу (inventory_id, created_at),
+        # поэтому окно открывается быстро и при длинном журнале.
+        self.history_model = SqlTableModel(
+            self.main_window.repo.conn, "stock_history",
+            [("created", "Дата"), ("operation", "Операция"),
+             ("change", "Изменение")],
+            sort_keys={0: ("created_at",)},
+            sort_column=0,
+            sort_order=Qt.SortOrder.DescendingOrder,
+            scope=("inventory_id = ?", (inventory_id,)),
+            source="stock_ledger",
+        )
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
+
+        self.balance_label = QLabel()
+        self.reconcile_button = QPushButton("Исправить расхождение")
+        self.reconcile_button.clicked.connect(self.reconcile)
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.dateChanged.connect(self.update_balance_at)
+        self.balance_at_label = QLabel()
+
+        date_layout = QHBoxLayout()
+        date_layout.addWidget(QLabel("Остаток на конец дня:"))
+        date_layout.addWidget(self.date_edit)
+        date_layout.addWidget(self.balance_at_label)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.balance_label)
+        layout.addWidget(self.reconcile_button)
+        layout.addLayout(date_layout)
+        layout.addWidget(self.history_table)
+        self.setLayout(layout)
+        self.update_table()
+        self.main_window.change_bus.changed.connect(self.data_changed)
+
+    def update_table(self):
+        try:
+            self.history_model.refresh()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Ошибка при загрузке данных: {e}")
+            return
+        self.update_balance()
+
+    def data_changed(self, changes):
+        if not self.isVisible():
+            return
+        try:
+            self.history_model.apply_changes(changes)
+        except sqlite3.Error as e:
+            print(f"Ошибка обновления истории запасов: {e}", file=sys.stderr)
+            return
+        if changes is None or "stock_ledger" in changes or "inventory" in changes:
+            self.update_balance()
+
+    def update_balance(self):
+        repo = self.main_window.repo
+        try:
+            item = repo.get_inventory_item(self.inventory_id)
+            balance = repo.stock_balance(self.inventory_id)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Ошибка при загрузке данных: {e}")
+            return
+        quantity = item[2] if item is not None else 0
+        text = f"Остаток: {quantity}"
+        if balance != quantity:
+            text += f" (по журналу {balance})"
+        self.balance_label.setText(text)
+        self.reconcile_button.setVisible(balance != quantity)
+        self.update_balance_at()
+
+    def update_balance_at(self):
+        end_of_day = datetime.datetime.combine(
+            self.date_edit.date().toPyDate(), datetime.time.max)
+        try:
+            balance = self.main_window.repo.stock_balance(
+                self.inventory_id, int(end_of_day.timestamp()))
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Ошибка при загрузке данных: {e}")
+            return
+        self.balance_at_label.setText(str(balance))
+
+    def reconcile(self):
+        try:
+            self.main_window.repo.reconcile_stock()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка базы данных: {e}")
+
+
+class EditInventoryDialog(QDialog):
+    data_changed = pyqtSignal(dict)
+
+    def __init__(self, inventory_item, main_window):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle("Редактировать элемент")
+        self.setGeometry(100, 100, 300, 150)
+        self.main_window = main_window
+
+        self.medicine_history = self.main_window.get_medicine_history()
+
+        medicine_label = QLabel("Лекарство:")
+        self.medicine_combobox = QComboBox()
+        self.medicine_combobox.addItems(self.medicine_history)
+        self.medicine_combobox.setEditable(True)
+        self.medicine_combobox.setCurrentText(inventory_item[1])
+
+        quantity_label = QLabel("Количество:")
+        self.quantity_spinbox = QSpinBox()
+        self.quantity_spinbox.setMinimum(0)
+        self.quantity_spinbox.setValue(inventory_item[2])
+
+        save_button = QPushButton("Сохранить")
+        save_button.clicked.connect(self.save_changes)
+
+        layout = QGridLayout()
+        layout.addWidget(medicine_label, 0, 0)
+        layout.addWidget(self.medicine_combobox, 0, 1)
+        layout.addWidget(quantity_label, 1, 0)
+        layout.addWidget(self.quantity_spinbox, 1, 1)
+        layout.addWidget(save_button, 2, 0, 1, 2)
+
+        self.setLayout(layout)
+
+    def save_changes(self):
+        medicine_name = self.medicine_combobox.currentText()
+        quantity = self.quantity_spinbox.value()
+
+        if not medicine_name.strip():
+            QMessageBox.warning(self, "Ошибка",
+                                "Введите корректное название лекарства")
+            return
+        if quantity <= 0:
+            QMessageBox.warning(self, "Ошибка",
+                                "Введите корректное количество таблеток")
+            return
+
+        inventory_data = {
+            "name": medicine_name,
+            "quantity": quantity,
+        }
+        self.data_changed.emit(inventory_data)
+        self.close()
+
+
+class HelpWindow(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Помощь")
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setFont(QFont("Arial", 11))
+        self.create_ui()
+        self.setFixedSize(800, 650)
+
+    def create_ui(self):
+        title_label = QLabel(
+            "<h1>Добро пожаловать!</h1>")
+        title_label.setStyleSheet(
+            "font-size: 17px;")
+        title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        introduction = QLabel(
+            """Это приложение поможет вам отслеживать приём лекарств и контролировать наличие запасов.
+             Перед использованием приложения необходимо добавить лекарства в запасы."""
+        )
+        introduction.setWordWrap(True)
+        introduction.setAlignment(Qt.AlignmentFlag.AlignLeft)
+
+        sections = [
+            ("Добавление лекарств в запасы", """1. Откройте окно «Запасы».
+2. Введите название лекарства в поле «Название лекарства».
+3. Укажите количество в поле «Количество».
+4. Нажмите кнопку «Сохранить»."""),
+            ("Добавление приема лекарств", """1. Откройте окно «Добавить прием».
+2. Выберите лекарство из выпадающего списка. Список содержит лекарства, добавленные в «Запасах».
+3. Укажите дозировку.
+4. Выберите дату и время приема.
+5. Нажмите кнопку «Сохранить». Приложение проверит наличие достаточного количества лекарства. При недостатке лекарства появится предупреждение.
+После добавления, количество лекарства уменьшится.  Если лекарство закончилось, появится сообщение об этом.
+Чтобы принимать лекарство курсом, нажмите «Повторять...» и укажите интервал и дату окончания. Приемы курса появляются в расписании на неделю вперед; запаса должно хватать на эту неделю, а если он закончится позже, следующие приемы появятся после пополнения. Если отметить «Запланировать курсом сразу», все приемы (до даты окончания или заданное число) сразу попадут в расписание, а запас будет проверен и списан на весь курс; при нехватке запаса курс не создается."""),
+            ("Прогноз запасов", """В окне «Запасы» для каждого лекарства показано, когда оно закончится с учетом запланированных приемов и курсов, и до какого дня его стоит купить. Начиная с этого дня приложение раз в день напоминает о пополнении запаса."""),
+            ("История запасов", """Кнопка «История» в окне «Запасы» показывает все изменения остатка выбранного лекарства: пополнения, списания под приемы, возвраты при отмене и исправления, а также остаток на конец любого дня. Если остаток разошелся с историей, его можно исправить кнопкой «Исправить расхождение»."""),
+            ("Соблюдение режима", """Кнопка «Соблюдение режима» показывает по каждому лекарству за выбранный период, сколько приемов записано в журнал, у скольких из них известно время получения и какая доля записана без задержки (не позже 15 минут после времени по графику), а также типичную (медиана) и большую (95%) задержку. Программа не спрашивает, выпито ли лекарство: прием из графика попадает в журнал, когда приходит напоминание, поэтому задержка показывает, насколько позже графика пришло напоминание (например, если программа была закрыта), а у приемов, внесенных вручную, — насколько позже указано время получения. Задержка известна с точностью до интервала, поэтому в столбцах медианы и 95% указан интервал. Отчет строится по ежедневным сводкам, поэтому и за несколько лет открывается сразу; приемы, перенесенные в архив, в нем учитываются."""),
+            ("Просмотр расписания", """В этом окне отображается список запланированных приемов лекарств, отсортированных по дате и времени."""),
+            ("Пациенты", """Каждый пациент ведется отдельно: выберите его в списке «Пациент» главного окна, чтобы увидеть его запасы, расписание и журнал. Новый пациент добавляется кнопкой «Добавить пациента». Напоминания приходят по всем пациентам."""),
+            ("Функция сброса данных", """Нажатие клавиши «D» на клавиатуре (в любом окне приложения) приведёт к удалению всех данных выбранного пациента.  Данная операция необратима!""")
+        ]
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(title_label)
+        main_layout.addWidget(introduction)
+
+        for title, content in sections:
+            section_title = QLabel(f"<h2>{title}</h2>")
+            section_title.setAlignment(Qt.AlignmentFlag.AlignLeft)
+            section_content = QLabel(content)
+            section_content.setWordWrap(True)
+            section_content.setAlignment(Qt.AlignmentFlag.AlignLeft)
+            main_layout.addWidget(section_title)
+            main_layout.addWidget(section_content)
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(QWidget())
+        scroll_area.widget().setLayout(main_layout)
+        scroll_area.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+
+        final_layout = QVBoxLayout()
+        final_layout.addWidget(scroll_area)
+        self.setLayout(final_layout)
+        self.image_label = QLabel()
+        self.image_label.setAlignment(
+            Qt.AlignmentFlag.AlignCenter)
+        self.image_label.setFixedSize(QSize(700, 350))
+        self.set_image(
+            "images/good_day.jpg")
+
+        main_layout.addWidget(
+            self.image_label)
+
+    def set_image(self, image_path):
+        try:
+            self.image_label.setPixmap(
+                assets.pixmap(image_path, self.image_label.size()))
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка",
+                                f"Не удалось загрузить изображение: {e}")
+
+
+class LogWindow(QWidget):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle("Журнал приема")
+        self.setStyleSheet(assets.background_style("images/log.jpg"))
+        self.setGeometry(100, 100, 550, 400)
+        self.main_window = main_window
+        self.selected_row = None
+
+        self.log_model = SqlTableModel(
+            self.main_window.repo.conn, "medicines_log",
+            [("name", "Лекарство"), ("dosage", "Дозировка"),
+             ("date", "Дата"), ("time", "Время"),
+             ("description", "Описание")],
+            sort_keys={2: ("date", "time"), 3: ("time", "date"),
+                       4: ("IFNULL(description, '')",)},
+            sort_column=2,
+            sort_order=Qt.SortOrder.DescendingOrder,
+            scope=self.main_window.repo.patient_scope(),
+            source="medicines_log",
+        )
+        self.log_table = QTableView()
+        self.log_table.setModel(self.log_model)
+        self.log_table.setSelectionBehavior(
+            QTableView.SelectionBehavior.SelectRows)
+        self.log_table.setSelectionMode(
+            QTableView.SelectionMode.SingleSelection)
+        self.log_table.horizontalHeader().setSortIndicator(
+            2, Qt.SortOrder.DescendingOrder)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск...")
+        self.search_controller = SearchController(
+            self.log_model, "medicines_log", self.main_window.repo.database)
+        self.search_edit.textChanged.connect(self.search_controller.search)
+
+        self.add_or_edit_button = QPushButton("Добавить/Изменить событие")
+        self.add_or_edit_button.clicked.connect(self.add_or_edit_description)
+        self.add_or_edit_button.setEnabled(
+            False)
+
+        self.export_button = QPushButton("Экспорт...")
+        self.export_button.clicked.connect(self.export_log)
+
+        self.archive_checkbox = QCheckBox("Искать в архиве")
+        self.archive_checkbox.toggled.connect(self.toggle_archive)
+
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_edit)
+        search_layout.addWidget(self.archive_checkbox)
+
+        layout = QVBoxLayout()
+        layout.addLayout(search_layout)
+        layout.addWidget(self.log_table)
+        layout.addWidget(self.add_or_edit_button)
+        layout.addWidget(self.export_button)
+        self.setLayout(layout)
+
+        self.log_table.selectionModel().selectionChanged.connect(
+            self.handle_selection_changed
+        )
+        self.log_model.modelReset.connect(self.handle_model_reset)
+        self.log_model.rowsInserted.connect(self.sync_selection)
+        self.log_model.rowsRemoved.connect(self.sync_selection)
+        self.log_table.setSortingEnabled(True)
+        self.main_window.change_bus.changed.connect(self.data_changed)
+
+    def update_table(self):
+        self.log_model.refresh()
+
+    def data_changed(self, changes):
+        if not self.isVisible():
+            return
+        try:
+            self.log_model.apply_changes(changes)
+        except sqlite3.Error as e:
+            print(f"Ошибка обновления журнала: {e}", file=sys.stderr)
+
+    def add_or_edit_description(self):
+        if self.selected_row is not None:
+            description, ok = QInputDialog.getText(
+                self, "Описание", "Введите описание приема:",
+                QLineEdit.EchoMode.Normal
+            )
+            if ok:
+                try:
+                    medicine_id = self.log_model.row_id(self.selected_row)
+                    if medicine_id is None:
+                        QMessageBox.critical(self, "Ошибка",
+                                             "Не удалось получить ID записи.")
+                        return
+
+                    if not self.main_window.repo.set_log_description(
+                            medicine_id, description):
+                        QMessageBox.warning(
+                            self, "Ошибка",
+                            "Запись находится в архиве и не может быть изменена.")
+                        return
+                    QMessageBox.information(self, "Успешно",
+                                            f"Описание добавлено/изменено в журнале")
+
+                except sqlite3.Error as e:
+                    QMessageBox.critical(self, "Ошибка БД",
+                                         f"Ошибка при работе с базой данных: {e}")
+                except Exception as e:
+                    QMessageBox.critical(self, "Ошибка",
+                                         f"Произошла неизвестная ошибка: {e}")
+                    import traceback
+                    traceback.print_exc()
+
+    def toggle_archive(self, checked):
+        if checked:
+            try:
+                schemas = archive.attach_archives(self.main_window.repo.conn)
+            except sqlite3.Error as e:
+                QMessageBox.critical(self, "Ошибка",
+                                     f"Не удалось открыть архив: {e}")
+                return
+            self.log_model.table = archive.ALL_LOG_VIEW
+        else:
+            schemas = ("main",)
+            self.log_model.table = "medicines_log"
+            self.detach_archives()
+        self.search_controller.schemas = schemas
+        self.search_log(self.search_edit.text())
+
+    def detach_archives(self):
+        try:
+            archive.detach_archives(self.main_window.repo.conn)
+        except sqlite3.Error as e:
+            print(f"Ошибка отключения архива: {e}", file=sys.stderr)
+
+    def closeEvent(self, event):
+        if self.archive_checkbox.isChecked():
+            self.detach_archives()
+        super().closeEvent(event)
+
+    def export_log(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт журнала", "medicines_log.csv",
+            "CSV (*.csv);;JSON Lines (*.jsonl)")
+        if not path:
+            return
+        try:
+            count = bulk_io.export_file(self.main_window.repo, "log", path)
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка экспорта: {e}")
+            return
+        QMessageBox.information(self, "Экспорт журнала",
+                                f"Выгружено записей: {count}")
+
+    def search_log(self, text):
+        self.log_model.set_filter(*search_filter(
+            "medicines_log", text, self.search_controller.schemas))
+
+    def handle_selection_changed(self, selected, deselected):
+        if selected.indexes():
+            self.selected_row = selected.indexes()[0].row()
+            self.add_or_edit_button.setEnabled(True)
+        else:
+            self.selected_row = None
+            self.add_or_edit_button.setEnabled(False)
+
+    def sync_selection(self):
+        rows = self.log_table.selectionModel().selectedRows()
+        self.selected_row = rows[0].row() if rows else None
+        self.add_or_edit_button.setEnabled(self.selected_row is not None)
+
+    def handle_model_reset(self):
+        self.selected_row = None
+        self.add_or_edit_button.setEnabled(False)
+
+
+def format_minutes(minutes):
+    if minutes < 60:
+        return f"{minutes} мин"
+    if minutes < 24 * 60:
+        return f"{minutes // 60} ч"
+    return f"{minutes // 1440} дн"
+
+
+def format_lateness(minutes):
+    # Процентиль известен с точностью до интервала задержки, показывается
+    # весь интервал, а не его нижняя граница.
+    if minutes is None:
+        return ""
+    index = adherence.BUCKETS.index(minutes)
+    if index == 0:
+        return f"до {format_minutes(adherence.BUCKETS[1])}"
+    if index + 1 == len(adherence.BUCKETS):
+        return f"больше {format_minutes(minutes)}"
+    return (f"{format_minutes(minutes)} – "
+            f"{format_minutes(adherence.BUCKETS[index + 1])}")
+
+
+class AdherenceWindow(QWidget):
+    COLUMNS = ["Лекарство", "Записей в журнале", "С временем получения",
+               "Без задержки", "Задержка, медиана", "Задержка, 95%"]
+
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle("Соблюдение режима")
+        self.setGeometry(100, 100, 700, 400)
+        self.main_window = main_window
+
+        self.start_edit = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.start_edit.setCalendarPopup(True)
+        self.start_edit.dateChanged.connect(self.update_table)
+        self.end_edit = QDateEdit(QDate.currentDate())
+        self.end_edit.setCalendarPopup(True)
+        self.end_edit.dateChanged.connect(self.update_table)
+
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel("С:"))
+        period_layout.addWidget(self.start_edit)
+        period_layout.addWidget(QLabel("по:"))
+        period_layout.addWidget(self.end_edit)
+        period_layout.addStretch(1)
+
+        self.report_table = QTableWidget(0, len(self.COLUMNS))
+        self.report_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.report_table.setEditTriggers(
+            QTableWidget.EditTrigger.NoEditTriggers)
+        # Ширина столбцов подбирается по первым строкам, а не по всем
+        # лекарствам отчета.
+        self.report_table.horizontalHeader().setResizeContentsPrecision(50)
+
+        layout = QVBoxLayout()
+        layout.addLayout(period_layout)
+        layout.addWidget(self.report_table)
+        self.setLayout(layout)
+        self.update_table()
+        self.main_window.change_bus.changed.connect(self.data_changed)
+
+    def update_table(self):
+        # Отчет складывает дневные сводки, журнал при этом не читается.
+        try:
+            rows = self.main_window.repo.adherence_report(
+                self.start_edit.date().toString("yyyy-MM-dd"),
+                self.end_edit.date().toString("yyyy-MM-dd"))
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Ошибка при загрузке данных: {e}")
+            return
+        self.report_table.setRowCount(len(rows))
+        for row, item in enumerate(rows):
+            values = [item.name or "Всего", item.logged, item.received,
+                      f"{round(item.on_time * 100 / item.logged)}%",
+                      format_lateness(item.median_minutes),
+                      format_lateness(item.p95_minutes)]
+            for column, value in enumerate(values):
+                self.report_table.setItem(
+                    row, column, QTableWidgetItem(str(value)))
+        self.report_table.resizeColumnsToContents()
+
+    def data_changed(self, changes):
+        if not self.isVisible():
+            return
+        if (changes is None or "medicines_log" in changes
+                or "adherence_daily" in changes):
+            self.update_table()
+
+
+class DiagnosticsWindow(QWidget):
+    COLUMNS = ["Запрос", "Выполнений", "Строк", "Всего, мс", "p95, мс",
+               "Полный проход"]
+
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowIcon(
+            QIcon('images/icon.ico'))
+        self.setWindowTitle("Диагностика")
+        self.setGeometry(100, 100, 900, 500)
+        self.main_window = main_window
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        self.statements_table = QTableWidget(0, len(self.COLUMNS))
+        self.statements_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.statements_table.setEditTriggers(
+            QTableWidget.EditTrigger.NoEditTriggers)
+
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(self.update_table)
+        reset_button = QPushButton("Сбросить")
+        reset_button.clicked.connect(self.reset_stats)
+        save_button = QPushButton("Сохранить в JSON...")
+        save_button.clicked.connect(self.save_stats)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(refresh_button)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(save_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.statements_table)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+        self.update_table()
+
+    def update_table(self):
+        snapshot = instrumentation.profiler.snapshot()
+        cache = self.main_window.repo.cache.stats()
+        if instrumentation.profile_path():
+            summary = (f"Запросов SQLite: {snapshot['traced_statements']}, "
+                       f"с полным проходом по таблице: {snapshot['full_scans']}. ")
+        else:
+            summary = (f"Профилирование SQL выключено, запустите программу с "
+                       f"переменной {instrumentation.PROFILE_VARIABLE}=файл.json. ")
+        self.summary_label.setText(
+            summary + f"Кэш запасов: попаданий {cache['hits']}, "
+            f"промахов {cache['misses']}, сбросов {cache['invalidations']}.")
+
+        statements = snapshot["statements"]
+        self.statements_table.setRowCount(len(statements))
+        for row, item in enumerate(statements):
+            values = [item["sql"], item["count"], item["rows"],
+                      f"{item['total_ms']:.2f}", f"{item['p95_ms']:.2f}",
+                      "да" if item["full_scan"] else ""]
+            for column, value in enumerate(values):
+                cell = QTableWidgetItem(str(value))
+                if column == 0 and item["plan"]:
+                    cell.setToolTip("\n".join(item["plan"]))
+                self.statements_table.setItem(row, column, cell)
+        self.statements_table.resizeColumnsToContents()
+
+    def reset_stats(self):
+        instrumentation.profiler.reset()
+        self.update_table()
+
+    def save_stats(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить статистику", "sql_profile.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            instrumentation.profiler.dump(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка",
+                                 f"Не удалось сохранить статистику: {e}")